@@ -5,7 +5,7 @@ from bson import ObjectId
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from api.db import auth_tokens, users
+from api.db import auth_tokens
 from api.schemas.user import UserData
 
 _INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
@@ -30,17 +30,10 @@ CurrentUserID = Annotated[ObjectId, Depends(get_current_user_id)]
 async def get_current_user(
     authorization: Annotated[HTTPAuthorizationCredentials, Depends(auth_scheme)]
 ) -> UserData:
-    token = await auth_tokens.get(authorization.credentials)
-
-    if not token:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    user_id = token.user_id
-
-    user = await users.get(user_id)
+    user = await auth_tokens.get_user(authorization.credentials)
 
     if not user:
-        raise HTTPException(status_code=401, detail="Current user not found")
+        raise HTTPException(status_code=401, detail="Invalid token")
 
     return user
 
@@ -1,7 +1,9 @@
 from pydantic import BaseModel, ConfigDict
 
 from api.schemas.objectid import PyObjectId
+from api.schemas.user import UserData
 
+from . import users
 from .client import db
 
 
@@ -19,6 +21,30 @@ async def create(auth_token: AuthToken):
     await auth_tokens.insert_one(auth_token.model_dump())
 
 
+# tokens are looked up on every request and never cached, so a token deleted
+# from the database stops working in every process at once
 async def get(secret: str):
     auth_token = await auth_tokens.find_one({"secret": secret})
     return AuthToken(**auth_token) if auth_token else None
+
+
+# resolves the token's user in the same round trip
+async def get_user(secret: str) -> UserData | None:
+    cursor = auth_tokens.aggregate(
+        [
+            {"$match": {"secret": secret}},
+            {"$limit": 1},
+            {
+                "$lookup": {
+                    "from": users.users.name,
+                    "localField": "user_id",
+                    "foreignField": "_id",
+                    "as": "user",
+                }
+            },
+            {"$unwind": "$user"},
+            {"$replaceRoot": {"newRoot": "$user"}},
+        ]
+    )
+    results = await cursor.to_list(length=1)
+    return UserData(**results[0]) if results else None
@@ -1,70 +1,290 @@
+import asyncio
+import os
 from typing import Any, Literal, overload
 
 from bson import ObjectId
+from pydantic import TypeAdapter
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 
 from api.schemas.conversation import (
     BaseConversation,
     ConversationData,
     ConversationDescriptorData,
+    ConversationElement,
+    ConversationInfo,
     ConversationStage,
     LevelConversationScenario,
     LevelConversationStage,
+    NpMessageOptionsLogEntry,
     PlaygroundConversationScenario,
     PlaygroundConversationStage,
     conversation_info_adapter,
+    conversation_state_adapter,
 )
+from api.schemas.persona import AgentPersona
 
 from .client import db
+from .ttl_cache import TTLCache
 
 conversations = db.conversations
+# append-only log of every element and event, the head document only keeps state
+# and the most recent elements
+conversation_history = db.conversation_history
+
+HISTORY_WINDOW = 16
+
+_elements_adapter = TypeAdapter(list[ConversationElement])
+
+# info and agent never change after insert, so the validated models are reused
+# across steps instead of being read and validated again
+_IMMUTABLE: TTLCache[ObjectId, tuple[ConversationInfo, AgentPersona]] = TTLCache(
+    max_entries=int(os.environ.get("CONVERSATION_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("CONVERSATION_CACHE_TTL", "3600")),
+)
+
+
+class VersionConflict(Exception):
+    pass
 
 
 async def get(conversation_id: ObjectId, user_id: ObjectId) -> ConversationData | None:
+    cached = _IMMUTABLE.get(conversation_id)
+    projection = {"events": 0, "pending_history": 0}
+    if cached:
+        projection |= {"info": 0, "agent": 0}
+
     conversation = await conversations.find_one(
-        {"_id": conversation_id, "user_id": user_id}
+        {"_id": conversation_id, "user_id": user_id}, projection
+    )
+    if not conversation:
+        return None
+
+    if "history_length" not in conversation:
+        conversation = await _migrate_to_history(conversation_id)
+
+    if cached:
+        conversation["info"], conversation["agent"] = cached
+
+    data = ConversationData(**conversation)
+    _IMMUTABLE.set(data.id, (data.info, data.agent))
+    return data
+
+
+async def get_elements(conversation_id: ObjectId) -> list[ConversationElement]:
+    cursor = conversation_history.find(
+        {"conversation_id": conversation_id, "kind": "element"}, {"seq": 1, "entry": 1}
+    ).sort("seq", 1)
+    head, history = await asyncio.gather(
+        conversations.find_one(
+            {"_id": conversation_id}, {"history_length": 1, "pending_history": 1}
+        ),
+        cursor.to_list(length=None),
+    )
+
+    entries = {e["seq"]: e["entry"] for e in history}
+    for e in _pending_history(conversation_id, head):
+        if e["kind"] == "element":
+            entries.setdefault(e["seq"], e["entry"])
+
+    return _elements_adapter.validate_python([entries[seq] for seq in sorted(entries)])
+
+
+def _history_entries(
+    conversation_id: ObjectId,
+    start: int,
+    events: list[dict[str, Any]],
+    elements: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    entries = [("event", entry) for entry in events] + [
+        ("element", entry) for entry in elements
+    ]
+    return [
+        {
+            "conversation_id": conversation_id,
+            "seq": start + i,
+            "kind": kind,
+            "entry": entry,
+        }
+        for i, (kind, entry) in enumerate(entries)
+    ]
+
+
+# the head keeps the entries of its last update until the next one, so they are
+# not lost if writing them to the history collection fails
+def _pending_history(
+    conversation_id: ObjectId, head: dict[str, Any] | None
+) -> list[dict[str, Any]]:
+    pending = head.get("pending_history") if head else None
+    if not pending:
+        return []
+
+    assert head is not None
+    start = head["history_length"] - len(pending["events"]) - len(pending["elements"])
+    return _history_entries(
+        conversation_id, start, pending["events"], pending["elements"]
+    )
+
+
+async def _append_history(entries: list[dict[str, Any]]):
+    if not entries:
+        return
+
+    try:
+        await conversation_history.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # entries already written are identical, (conversation_id, seq) is unique
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+# conversations stored before the history collection embed their full history
+async def _migrate_to_history(conversation_id: ObjectId) -> dict[str, Any]:
+    conversation = await conversations.find_one({"_id": conversation_id})
+    assert conversation is not None
+
+    if "history_length" not in conversation:
+        events = conversation.get("events", [])
+        elements = conversation.get("elements", [])
+
+        # another request may be migrating the same conversation
+        await _append_history(_history_entries(conversation_id, 0, events, elements))
+
+        await conversations.update_one(
+            {"_id": conversation_id, "history_length": {"$exists": False}},
+            {
+                "$set": {
+                    "history_length": len(events) + len(elements),
+                    "elements": elements[-HISTORY_WINDOW:],
+                },
+                "$unset": {"events": ""},
+            },
+        )
+
+    conversation = await conversations.find_one({"_id": conversation_id}, {"events": 0})
+    assert conversation is not None
+    return conversation
+
+
+# rewrites state data stored as nested models to state paths, which is also done
+# whenever a conversation is updated; returns the number of conversations and
+# history entries rewritten
+async def migrate_state_paths() -> tuple[int, int]:
+    migrated_conversations = 0
+    cursor = conversations.find(
+        {
+            "$or": [
+                {"state.data": {"$type": "object"}},
+                {"state.options.next": {"$type": "object"}},
+            ]
+        },
+        {"state": 1, "version": 1},
+    )
+    async for conversation in cursor:
+        state = conversation_state_adapter.validate_python(conversation["state"])
+        # skipped if progressed meanwhile, which writes the new format anyway
+        res = await conversations.update_one(
+            {"_id": conversation["_id"], "version": conversation.get("version")},
+            {"$set": {"state": conversation_state_adapter.dump_python(state)}},
+        )
+        migrated_conversations += res.modified_count
+
+    migrated_entries = 0
+    cursor = conversation_history.find(
+        {
+            "kind": "event",
+            "entry.type": "np_options",
+            "entry.options.next": {"$type": "object"},
+        },
+        {"entry": 1},
     )
+    async for entry in cursor:
+        event = NpMessageOptionsLogEntry(**entry["entry"])
+        res = await conversation_history.update_one(
+            {"_id": entry["_id"]}, {"$set": {"entry": event.model_dump()}}
+        )
+        migrated_entries += res.modified_count
 
-    return ConversationData(**conversation) if conversation else None
+    return migrated_conversations, migrated_entries
 
 
 async def insert(
     conversation: BaseConversation,
 ) -> ConversationData:
-    res = await conversations.insert_one(conversation.model_dump())
+    head = conversation.model_dump(exclude={"events"})
+    head["_id"] = ObjectId()
+    head["elements"] = head["elements"][-HISTORY_WINDOW:]
+    head["history_length"] = len(conversation.events) + len(conversation.elements)
 
-    return ConversationData(id=res.inserted_id, **conversation.model_dump())
+    # the history is written first, so a head is never without it
+    dumped = conversation.model_dump(include={"events", "elements"})
+    await _append_history(
+        _history_entries(head["_id"], 0, dumped["events"], dumped["elements"])
+    )
+    await conversations.insert_one(head)
+
+    data = ConversationData(id=head["_id"], **conversation.model_dump())
+    _IMMUTABLE.set(data.id, (data.info, data.agent))
+    return data
 
 
 async def update(conversation: ConversationData):
-    await conversations.update_one(
+    events = conversation.unstored("events") or range(0)
+    elements = conversation.unstored("elements")
+
+    dumped = conversation.model_dump(
+        include={
+            "state": True,
+            "events": set(events),
+            "elements": True if elements is None else set(elements),
+        }
+    )
+    new_events = dumped["events"]
+    new_elements = [] if elements is None else dumped["elements"]
+
+    changes: dict[str, Any] = {
+        "$set": {
+            "state": dumped["state"],
+            "pending_history": {"events": new_events, "elements": new_elements},
+        },
+        "$inc": {"version": 1, "history_length": len(new_events) + len(new_elements)},
+    }
+    if elements is None:
+        # shortened, history stays as written
+        changes["$set"]["elements"] = dumped["elements"][-HISTORY_WINDOW:]
+    elif new_elements:
+        changes["$push"] = {
+            "elements": {"$each": new_elements, "$slice": -HISTORY_WINDOW}
+        }
+
+    previous = await conversations.find_one_and_update(
         {
             "_id": conversation.id,
             "user_id": conversation.user_id,
+            # documents written before versioning have no version field
+            "version": conversation.version or {"$in": [0, None]},
         },
-        {"$set": conversation.model_dump(exclude={"id"})},
+        changes,
+        {"history_length": 1, "pending_history": 1},
+        return_document=ReturnDocument.BEFORE,
     )
 
+    if previous is None:
+        raise VersionConflict()
 
-async def query(user_id: ObjectId, stage: ConversationStage):
-    match stage:
-        case LevelConversationStage(level=level):
-            query = {
-                "user_id": user_id,
-                "info.type": "level",
-                "info.level": level,
-            }
-        case PlaygroundConversationStage():
-            query = {"user_id": user_id, "info.type": "playground"}
-        case _:
-            raise ValueError("Invalid stage")
+    # the previous update's entries again, in case writing them failed
+    await _append_history(
+        _pending_history(conversation.id, previous)
+        + _history_entries(
+            conversation.id, previous["history_length"], new_events, new_elements
+        )
+    )
 
-    cursor = conversations.find(query, {"_id": 1, "info": 1, "agent": 1})
-    return [ConversationDescriptorData(**conversation) async for conversation in cursor]
+    conversation.version += 1
+    conversation.mark_stored()
 
 
-async def query_one(
-    user_id: ObjectId, stage: ConversationStage
-) -> ConversationData | None:
+async def query(user_id: ObjectId, stage: ConversationStage):
     match stage:
         case LevelConversationStage(level=level):
             query = {
@@ -77,9 +297,8 @@ async def query_one(
         case _:
             raise ValueError("Invalid stage")
 
-    conversation = await conversations.find_one(query)
-
-    return ConversationData(**conversation) if conversation else None
+    cursor = conversations.find(query, {"_id": 1, "info": 1, "agent": 1})
+    return [ConversationDescriptorData(**conversation) async for conversation in cursor]
 
 
 @overload
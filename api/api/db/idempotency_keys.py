@@ -0,0 +1,64 @@
+from datetime import UTC, datetime
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+from pymongo.errors import DuplicateKeyError
+
+from .client import db
+
+
+class IdempotencyRecord(BaseModel):
+    id: str = Field(alias="_id")
+    fingerprint: str
+    status: Literal["pending", "done"]
+    response: str | None = None
+    locked_until: datetime
+    expires_at: datetime
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+idempotency_keys = db.idempotency_keys
+
+
+# returns None if the key was claimed, otherwise the record holding it
+async def claim(record: IdempotencyRecord) -> IdempotencyRecord | None:
+    try:
+        await idempotency_keys.insert_one(record.model_dump(by_alias=True))
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # take over keys left pending by a request that never finished
+    stale = await idempotency_keys.find_one_and_update(
+        {
+            "_id": record.id,
+            "status": "pending",
+            "locked_until": {"$lt": datetime.now(UTC)},
+        },
+        {"$set": record.model_dump(exclude={"id"})},
+    )
+    if stale is not None:
+        return None
+
+    existing = await idempotency_keys.find_one({"_id": record.id})
+    if existing is None:
+        # released or expired in the meantime
+        return await claim(record)
+
+    return IdempotencyRecord(**existing)
+
+
+async def get(id: str) -> IdempotencyRecord | None:
+    record = await idempotency_keys.find_one({"_id": id})
+    return IdempotencyRecord(**record) if record else None
+
+
+async def complete(id: str, response: str):
+    await idempotency_keys.update_one(
+        {"_id": id}, {"$set": {"status": "done", "response": response}}
+    )
+
+
+async def release(id: str):
+    await idempotency_keys.delete_one({"_id": id, "status": "pending"})
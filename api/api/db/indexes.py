@@ -0,0 +1,197 @@
+import logging
+import os
+from typing import Any
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel, ConfigDict
+from pymongo import ASCENDING, IndexModel
+
+from .client import db
+
+CHECK_QUERY_PLANS = os.environ.get("MONGO_CHECK_QUERY_PLANS", "0") == "1"
+
+
+class QueryShape(BaseModel):
+    name: str
+    filter: dict[str, Any]
+    sort: list[tuple[str, int]] | None = None
+
+
+class CollectionIndexes(BaseModel):
+    indexes: list[IndexModel]
+    # representative filters for the lookups made in db/*, checked by explain()
+    queries: list[QueryShape]
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+COLLECTIONS: dict[str, CollectionIndexes] = {
+    "auth_tokens": CollectionIndexes(
+        indexes=[IndexModel("secret", unique=True)],
+        queries=[QueryShape(name="auth_tokens.get", filter={"secret": ""})],
+    ),
+    "magic_links": CollectionIndexes(
+        indexes=[IndexModel("secret", unique=True)],
+        queries=[QueryShape(name="magic_links.get", filter={"secret": ""})],
+    ),
+    "users": CollectionIndexes(
+        indexes=[IndexModel("qa_id")],
+        queries=[
+            QueryShape(name="users.get", filter={"_id": ObjectId()}),
+            QueryShape(name="users.get_by_qa_id", filter={"qa_id": ""}),
+        ],
+    ),
+    "conversations": CollectionIndexes(
+        indexes=[
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("info.type", ASCENDING),
+                    ("info.level", ASCENDING),
+                ]
+            )
+        ],
+        queries=[
+            QueryShape(
+                name="conversations.get",
+                filter={"_id": ObjectId(), "user_id": ObjectId()},
+            ),
+            QueryShape(
+                name="conversations.query (level)",
+                filter={"user_id": ObjectId(), "info.type": "level", "info.level": 1},
+            ),
+            QueryShape(
+                name="conversations.query (playground)",
+                filter={"user_id": ObjectId(), "info.type": "playground"},
+            ),
+            QueryShape(
+                name="conversations.get_previous_info",
+                filter={"user_id": ObjectId(), "scenario.type": "level"},
+            ),
+        ],
+    ),
+    "conversation_history": CollectionIndexes(
+        indexes=[
+            IndexModel(
+                [("conversation_id", ASCENDING), ("seq", ASCENDING)], unique=True
+            )
+        ],
+        queries=[
+            QueryShape(
+                name="conversations.get_elements",
+                filter={"conversation_id": ObjectId(), "kind": "element"},
+                sort=[("seq", ASCENDING)],
+            )
+        ],
+    ),
+    "warm_conversations": CollectionIndexes(
+        indexes=[
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("stage", ASCENDING),
+                    ("fingerprint", ASCENDING),
+                    ("created_at", ASCENDING),
+                ]
+            ),
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ],
+        queries=[
+            QueryShape(
+                name="warm_conversations.pop",
+                filter={
+                    "user_id": ObjectId(),
+                    "stage": "",
+                    "fingerprint": "",
+                    "created_at": {"$gt": 0},
+                },
+                sort=[("created_at", ASCENDING)],
+            ),
+            QueryShape(
+                name="warm_conversations.prune",
+                filter={"user_id": ObjectId(), "stage": ""},
+            ),
+        ],
+    ),
+    "warm_conversation_fills": CollectionIndexes(
+        indexes=[IndexModel("leased_until", expireAfterSeconds=0)],
+        queries=[
+            QueryShape(
+                name="warm_conversations.lock_fill",
+                filter={"_id": "", "leased_until": {"$lte": 0}},
+            )
+        ],
+    ),
+    "jobs": CollectionIndexes(
+        indexes=[
+            IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+            IndexModel([("status", ASCENDING), ("leased_until", ASCENDING)]),
+            # only failed jobs have an expiry; done jobs are deleted outright
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ],
+        queries=[
+            QueryShape(
+                name="jobs.claim",
+                filter={
+                    "kind": {"$in": [""]},
+                    "$or": [
+                        {"status": "pending", "run_at": {"$lte": 0}},
+                        {"status": "running", "leased_until": {"$lt": 0}},
+                    ],
+                },
+                sort=[("run_at", ASCENDING)],
+            ),
+        ],
+    ),
+    "llm_cache": CollectionIndexes(
+        indexes=[IndexModel("expires_at", expireAfterSeconds=0)],
+        queries=[QueryShape(name="llm_cache.get", filter={"_id": ""})],
+    ),
+    "idempotency_keys": CollectionIndexes(
+        indexes=[IndexModel("expires_at", expireAfterSeconds=0)],
+        queries=[QueryShape(name="idempotency_keys.get", filter={"_id": ""})],
+    ),
+}
+
+
+class CollectionScan(Exception):
+    pass
+
+
+# creating an index that already exists with the same options is a no-op
+async def ensure_indexes():
+    for name, collection in COLLECTIONS.items():
+        created = await db[name].create_indexes(collection.indexes)
+        logging.info(f"Indexes on {name}: {', '.join(created)}")
+
+
+def _stages(plan: Any):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+async def _winning_plan(collection: AsyncIOMotorCollection, query: QueryShape):
+    cursor = collection.find(query.filter)
+    if query.sort:
+        cursor = cursor.sort(query.sort)
+    explained = await cursor.explain()
+    return explained["queryPlanner"]["winningPlan"]
+
+
+async def check_query_plans():
+    scans = []
+    for name, collection in COLLECTIONS.items():
+        for query in collection.queries:
+            plan = await _winning_plan(db[name], query)
+            if "COLLSCAN" in _stages(plan):
+                scans.append(query.name)
+
+    if scans:
+        raise CollectionScan(f"Queries would scan whole collections: {scans}")
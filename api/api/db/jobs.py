@@ -0,0 +1,98 @@
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .client import db
+
+jobs = db.jobs
+
+
+async def insert(name: str, kind: str, payload: dict[str, Any]) -> bool:
+    now = datetime.now(UTC)
+    job = {
+        "kind": kind,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "run_at": now,
+        "leased_until": None,
+        "last_error": None,
+        "expires_at": None,
+        "created_at": now,
+    }
+
+    try:
+        await jobs.insert_one({"_id": name, **job})
+        return True
+    except DuplicateKeyError:
+        # a job that already gave up may be queued again under the same name
+        res = await jobs.update_one({"_id": name, "status": "failed"}, {"$set": job})
+        return res.modified_count > 0
+
+
+async def claim(kinds: list[str], lease: float) -> dict[str, Any] | None:
+    now = datetime.now(UTC)
+    return await jobs.find_one_and_update(
+        {
+            "kind": {"$in": kinds},
+            "$or": [
+                {"status": "pending", "run_at": {"$lte": now}},
+                # the worker holding it went away without finishing
+                {"status": "running", "leased_until": {"$lt": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": "running",
+                "leased_until": now + timedelta(seconds=lease),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def complete(name: str):
+    await jobs.delete_one({"_id": name, "status": "running"})
+
+
+async def retry(name: str, run_at: datetime, error: str):
+    await jobs.update_one(
+        {"_id": name, "status": "running"},
+        {
+            "$set": {
+                "status": "pending",
+                "run_at": run_at,
+                "leased_until": None,
+                "last_error": error,
+            }
+        },
+    )
+
+
+async def fail(name: str, expires_at: datetime, error: str):
+    await jobs.update_one(
+        {"_id": name, "status": "running"},
+        {
+            "$set": {
+                "status": "failed",
+                "leased_until": None,
+                "last_error": error,
+                "expires_at": expires_at,
+            }
+        },
+    )
+
+
+async def release(name: str):
+    # handed back on shutdown, so the attempt does not count
+    await jobs.update_one(
+        {"_id": name, "status": "running"},
+        {
+            "$set": {"status": "pending", "leased_until": None},
+            "$inc": {"attempts": -1},
+        },
+    )
@@ -0,0 +1,21 @@
+from datetime import UTC, datetime
+from typing import Any
+
+from .client import db
+
+llm_cache = db.llm_cache
+
+
+async def get(key: str) -> Any | None:
+    entry = await llm_cache.find_one(
+        {"_id": key, "expires_at": {"$gt": datetime.now(UTC)}}
+    )
+    return entry["value"] if entry else None
+
+
+async def set(key: str, value: Any, expires_at: datetime):
+    await llm_cache.update_one(
+        {"_id": key},
+        {"$set": {"value": value, "expires_at": expires_at}},
+        upsert=True,
+    )
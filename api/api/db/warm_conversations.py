@@ -0,0 +1,119 @@
+from datetime import UTC, datetime, timedelta
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from api.schemas.conversation import BaseConversation, ConversationStage
+
+from .client import db
+
+warm_conversations = db.warm_conversations
+warm_conversation_fills = db.warm_conversation_fills
+
+
+async def push(
+    user_id: ObjectId,
+    stage: ConversationStage,
+    fingerprint: str,
+    conversation: BaseConversation,
+    expires_at: datetime,
+):
+    await warm_conversations.insert_one(
+        {
+            "user_id": user_id,
+            "stage": str(stage),
+            "fingerprint": fingerprint,
+            "created_at": datetime.now(UTC),
+            "expires_at": expires_at,
+            "conversation": conversation.model_dump(),
+        }
+    )
+
+
+async def pop(
+    user_id: ObjectId,
+    stage: ConversationStage,
+    fingerprint: str,
+    fresh_after: datetime,
+) -> BaseConversation | None:
+    entry = await warm_conversations.find_one_and_delete(
+        {
+            "user_id": user_id,
+            "stage": str(stage),
+            "fingerprint": fingerprint,
+            "created_at": {"$gt": fresh_after},
+        },
+        sort=[("created_at", 1)],
+    )
+
+    return BaseConversation(**entry["conversation"]) if entry else None
+
+
+async def count(
+    user_id: ObjectId,
+    stage: ConversationStage,
+    fingerprint: str,
+    fresh_after: datetime,
+) -> int:
+    return await warm_conversations.count_documents(
+        {
+            "user_id": user_id,
+            "stage": str(stage),
+            "fingerprint": fingerprint,
+            "created_at": {"$gt": fresh_after},
+        }
+    )
+
+
+async def prune(
+    user_id: ObjectId,
+    stage: ConversationStage,
+    fingerprint: str,
+    fresh_after: datetime,
+):
+    await warm_conversations.delete_many(
+        {
+            "user_id": user_id,
+            "stage": str(stage),
+            "$or": [
+                {"fingerprint": {"$ne": fingerprint}},
+                {"created_at": {"$lte": fresh_after}},
+            ],
+        }
+    )
+
+
+def _fill_id(user_id: ObjectId, stage: ConversationStage) -> str:
+    return f"{user_id}_{stage}"
+
+
+# only one process fills a (user, stage) pool at a time; the lease lets another
+# take over if the one holding it went away
+async def lock_fill(
+    user_id: ObjectId, stage: ConversationStage, lease: float
+) -> datetime | None:
+    now = datetime.now(UTC)
+    leased_until = now + timedelta(seconds=lease)
+    # matched again on unlock, so keep it at the precision Mongo stores
+    leased_until = leased_until.replace(
+        microsecond=leased_until.microsecond // 1000 * 1000
+    )
+
+    try:
+        await warm_conversation_fills.update_one(
+            {"_id": _fill_id(user_id, stage), "leased_until": {"$lte": now}},
+            {"$set": {"leased_until": leased_until}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+
+    return leased_until
+
+
+async def unlock_fill(
+    user_id: ObjectId, stage: ConversationStage, leased_until: datetime
+):
+    await warm_conversation_fills.delete_one(
+        {"_id": _fill_id(user_id, stage), "leased_until": leased_until}
+    )
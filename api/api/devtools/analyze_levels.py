@@ -0,0 +1,258 @@
+import argparse
+
+from pydantic import BaseModel
+
+from api.levels.all import get_level_states
+from api.levels.compiled import CompiledStates
+from api.levels.states import AgentState, FeedbackState, MessageInstructions, UserState
+from api.schemas.conversation import LEVEL_MAX, LEVEL_MIN, LevelConversationStage
+from api.services import llm
+from api.services.feedback_generation import FEEDBACK_MODEL
+
+# Walks every reachable state of each level's compiled state table and reports
+# the min/expected/max LLM calls of progressing one conversation through it, and
+# the vendor slot-seconds (calls x latency) they hold, for sizing
+# ModelVendor.concurrency_limit and pregeneration throughput. Generating the
+# scenario and personas when a conversation is created isn't included.
+#
+# The user is assumed to pick uniformly among the presented options. Each
+# metric's min and max are over all paths, independently of the other metrics.
+# Latencies are rough defaults, measured ones are in /metrics/llm (latency_long):
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.analyze_levels \
+#       --latency GPT_4=12 --latency CLAUDE_3_SONNET=6
+
+_DEFAULT_LATENCY = {
+    llm.Model.GPT_4: 10.0,
+    llm.Model.GPT_3_5: 3.0,
+    llm.Model.CLAUDE_3_SONNET: 6.0,
+    llm.Model.CLAUDE_3_HAIKU: 3.0,
+}
+
+# conversation_handler presents at most this many options
+_MAX_OPTIONS = 3
+
+Costs = dict[str, float]
+
+
+class MetricRange(BaseModel):
+    min: float
+    expected: float
+    max: float
+
+
+class VendorLoad(BaseModel):
+    slot_seconds: MetricRange
+    # conversations a process can progress per hour with every slot busy
+    conversations_per_hour: float
+    conversations_per_hour_max: float
+
+
+class LevelReport(BaseModel):
+    level: int
+    states: int
+    metrics: dict[str, MetricRange]
+    vendors: dict[str, VendorLoad]
+
+
+def _slot_key(vendor: llm.ModelVendor) -> str:
+    return f"slot_seconds.{vendor.value}"
+
+
+def _llm_call(model: llm.Model, latency: dict[llm.Model, float]) -> Costs:
+    return {f"llm_calls.{model.name}": 1, _slot_key(model.vendor()): latency[model]}
+
+
+def _sum(*costs: Costs) -> Costs:
+    total: Costs = {}
+    for cost in costs:
+        for key, value in cost.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def _scale(cost: Costs, factor: float) -> Costs:
+    return {key: value * factor for key, value in cost.items()}
+
+
+def _bound(pool: list[Costs], count: int, largest: bool) -> Costs:
+    keys = {key for cost in pool for key in cost}
+    return {
+        key: sum(sorted((c.get(key, 0) for c in pool), reverse=largest)[:count])
+        for key in keys
+    }
+
+
+class _Analysis:
+    def __init__(self, states: CompiledStates, latency: dict[llm.Model, float]):
+        self.states = states
+        self.latency = latency
+
+        self._results: dict[int, tuple[Costs, Costs, Costs]] = {}
+
+    def _message(self, model: llm.Model) -> Costs:
+        return {"generate_message": 1, **_llm_call(model, self.latency)}
+
+    def _feedback(self) -> Costs:
+        # base feedback, follow-up message and explanation
+        follow_up_model = MessageInstructions.model_fields["model"].default
+        return _sum(
+            {"generate_feedback": 1},
+            _llm_call(FEEDBACK_MODEL, self.latency),
+            _llm_call(follow_up_model, self.latency),
+            _llm_call(FEEDBACK_MODEL, self.latency),
+        )
+
+    # (probability, min cost, max cost) of the state when each option is taken,
+    # and the expected cost of the state
+    def _choices(self, id: int) -> tuple[list[tuple[float, Costs, Costs]], Costs]:
+        state = self.states.state(id)
+
+        if isinstance(state, AgentState):
+            cost = _sum({"elements": 1}, self._message(state.instructions.model))
+            return [(1, cost, cost)], cost
+
+        if isinstance(state, FeedbackState):
+            # the feedback and the user's follow-up message
+            cost = _sum({"elements": 2}, self._feedback())
+            return [(1, cost, cost)], cost
+
+        assert isinstance(state, UserState)
+        options = [self._message(o.instructions.model) for o in state.options]
+        sample_from = self.states.sample_from(id)
+        if sample_from is not None:
+            shown, pool = options[:sample_from], options[sample_from:]
+            drawn = min(len(pool), _MAX_OPTIONS - len(shown))
+        elif len(options) > _MAX_OPTIONS:
+            shown, pool, drawn = [], options, _MAX_OPTIONS
+        else:
+            shown, pool, drawn = options, [], 0
+
+        fixed = _sum({"elements": 1}, *shown)
+        presented = len(shown) + drawn
+
+        choices = []
+        for i, option in enumerate(options):
+            if i < len(shown):
+                choices.append(
+                    (
+                        1 / presented,
+                        _sum(fixed, _bound(pool, drawn, False)),
+                        _sum(fixed, _bound(pool, drawn, True)),
+                    )
+                )
+            else:
+                rest = pool[: i - len(shown)] + pool[i - len(shown) + 1 :]
+                choices.append(
+                    (
+                        drawn / len(pool) / presented,
+                        _sum(fixed, option, _bound(rest, drawn - 1, False)),
+                        _sum(fixed, option, _bound(rest, drawn - 1, True)),
+                    )
+                )
+
+        expected = _sum(fixed, *[_scale(o, drawn / len(pool)) for o in pool])
+        return choices, expected
+
+    # min, expected and max cost from a state to the end of the conversation
+    def visit(self, id: int | None) -> tuple[Costs, Costs, Costs]:
+        if id is None:
+            return {}, {}, {}
+        if id in self._results:
+            return self._results[id]
+
+        choices, expected = self._choices(id)
+        lows, highs = [], []
+        for (probability, low, high), target in zip(
+            choices, self.states.targets(id), strict=True
+        ):
+            if probability == 0:
+                continue
+            rest_low, rest_expected, rest_high = self.visit(target)
+            lows.append(_sum(low, rest_low))
+            highs.append(_sum(high, rest_high))
+            expected = _sum(expected, _scale(rest_expected, probability))
+
+        keys = {key for cost in lows + highs for key in cost}
+        result = (
+            {key: min(c.get(key, 0) for c in lows) for key in keys},
+            expected,
+            {key: max(c.get(key, 0) for c in highs) for key in keys},
+        )
+        self._results[id] = result
+        return result
+
+
+def analyze_level(level: int, latency: dict[llm.Model, float]) -> LevelReport:
+    states = get_level_states(LevelConversationStage(level=level))
+
+    low, expected, high = _Analysis(states, latency).visit(states.init_id)
+    metrics = {
+        key: MetricRange(
+            min=low.get(key, 0), expected=expected.get(key, 0), max=high.get(key, 0)
+        )
+        for key in sorted(low.keys() | expected.keys() | high.keys())
+    }
+
+    vendors = {}
+    for vendor in llm.ModelVendor:
+        slot_seconds = metrics.get(_slot_key(vendor))
+        if slot_seconds is None or slot_seconds.expected == 0:
+            continue
+        vendors[vendor.value] = VendorLoad(
+            slot_seconds=slot_seconds,
+            conversations_per_hour=3600
+            * vendor.concurrency_limit()
+            / slot_seconds.expected,
+            conversations_per_hour_max=3600
+            * vendor.max_concurrency_limit()
+            / slot_seconds.expected,
+        )
+
+    return LevelReport(
+        level=level, states=len(states), metrics=metrics, vendors=vendors
+    )
+
+
+def _print(report: LevelReport):
+    print(f"Level {report.level} ({report.states} states)")
+    print(f"  {'':<32} {'min':>8} {'expected':>9} {'max':>8}")
+    for key, value in report.metrics.items():
+        print(f"  {key:<32} {value.min:>8.1f} {value.expected:>9.1f} {value.max:>8.1f}")
+    for vendor, load in report.vendors.items():
+        print(
+            f"  {vendor}: {load.conversations_per_hour:.0f} conversations/hour at "
+            f"the concurrency limit, {load.conversations_per_hour_max:.0f} at the "
+            "max concurrency limit"
+        )
+    print()
+
+
+def _parse_latency(value: str) -> tuple[llm.Model, float]:
+    model, seconds = value.split("=")
+    return llm.Model[model], float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level LLM cost analyzer")
+    parser.add_argument(
+        "--latency",
+        type=_parse_latency,
+        action="append",
+        default=[],
+        help="MODEL=SECONDS, the mean latency of a call to the model",
+    )
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    latency = {**_DEFAULT_LATENCY, **dict(args.latency)}
+    for level in range(LEVEL_MIN, LEVEL_MAX + 1):
+        report = analyze_level(level, latency)
+        if args.json:
+            print(report.model_dump_json())
+        else:
+            _print(report)
+
+
+if __name__ == "__main__":
+    main()
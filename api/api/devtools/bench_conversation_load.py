@@ -0,0 +1,136 @@
+import argparse
+import time
+from typing import Any
+
+from bson import ObjectId
+
+from api.db.conversations import HISTORY_WINDOW
+from api.levels.all import get_level_states
+from api.levels.states import AgentState, FeedbackState, UserState
+from api.schemas.conversation import (
+    AgentMessage,
+    ApMessageLogEntry,
+    BaseConversation,
+    ConversationData,
+    Feedback,
+    FeedbackElement,
+    FeedbackLogEntry,
+    LevelConversationInfo,
+    LevelConversationScenario,
+    MessageElement,
+    MessageOption,
+    NpMessageOptionsLogEntry,
+    NpMessageSelectedLogEntry,
+    StateActiveData,
+    UserMessage,
+)
+from api.schemas.persona import AgentPersona
+
+# Measures how long validating a loaded conversation takes per step, for the
+# document layouts a step has read over time:
+#
+#   full  - elements and events embedded in the conversation document
+#   head  - the latest elements only, history in its own collection
+#   lean  - head without info and agent, reused from the per-process cache
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.bench_conversation_load
+
+_TEXT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3
+
+
+def _walk(info: LevelConversationInfo, steps: int) -> BaseConversation:
+    # follows the level's state machine with placeholder text in place of the
+    # generated messages, restarting the level when it completes
+    states = get_level_states(info)
+    conversation = BaseConversation(
+        user_id=ObjectId(),
+        info=info,
+        agent=AgentPersona(
+            name="Agent",
+            age="30",
+            occupation="Engineer",
+            interests=["Reading", "Hiking"],
+            description=_TEXT,
+        ),
+        state=StateActiveData(data=states.init()),
+    )
+
+    for _ in range(steps):
+        assert isinstance(conversation.state, StateActiveData)
+        data = conversation.state.data or states.init()
+        state = states.next(data)
+
+        if isinstance(state, UserState):
+            options = [
+                MessageOption(response=_TEXT, next=opt.next) for opt in state.options
+            ][:3]
+            conversation.events.append(NpMessageOptionsLogEntry(options=options))
+            conversation.events.append(NpMessageSelectedLogEntry(message=_TEXT))
+            conversation.elements.append(
+                MessageElement(content=UserMessage(message=_TEXT))
+            )
+            conversation.state = StateActiveData(data=options[0].next)
+        elif isinstance(state, AgentState):
+            conversation.events.append(ApMessageLogEntry(message=_TEXT))
+            conversation.elements.append(
+                MessageElement(content=AgentMessage(message=_TEXT))
+            )
+            conversation.state = StateActiveData(data=state.next)
+        elif isinstance(state, FeedbackState):
+            feedback = Feedback(
+                title="Feedback", body=_TEXT, follow_up=None, explanation=_TEXT
+            )
+            conversation.events.append(FeedbackLogEntry(content=feedback))
+            conversation.elements.append(FeedbackElement(content=feedback))
+            conversation.state = StateActiveData(data=state.next)
+
+    return conversation
+
+
+def _documents(conversation: BaseConversation) -> dict[str, dict[str, Any]]:
+    full = {"_id": ObjectId(), **conversation.model_dump()}
+
+    head = {k: v for k, v in full.items() if k != "events"}
+    head["elements"] = head["elements"][-HISTORY_WINDOW:]
+
+    lean = {k: v for k, v in head.items() if k not in ("info", "agent")}
+    lean["info"] = conversation.info
+    lean["agent"] = conversation.agent
+
+    return {"full": full, "head": head, "lean": lean}
+
+
+def _time(document: dict[str, Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        # validation doesn't modify the document, so it can be reused
+        ConversationData(**document)
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation load benchmark")
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    args = parser.parse_args()
+
+    info = LevelConversationInfo(
+        level=args.level,
+        scenario=LevelConversationScenario(
+            user_perspective=_TEXT,
+            agent_perspective=_TEXT,
+            user_goal=_TEXT,
+            is_user_initiated=True,
+        ),
+    )
+
+    print(f"{'steps':>6} {'full':>10} {'head':>10} {'lean':>10}")
+    for steps in args.steps:
+        documents = _documents(_walk(info, steps))
+        timings = [_time(documents[k], args.repeat) for k in ("full", "head", "lean")]
+        print(f"{steps:>6}" + "".join(f" {t * 1e6:>8.1f}us" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import random
+import time
+from typing import Any
+
+from api.levels import level_1, level_2, level_3
+from api.levels.all import get_level_states
+from api.levels.states import BaseData, States, UserState
+from api.schemas.conversation import LevelConversationStage, StateActiveData
+
+# Compares next() of the compiled level state tables against the recursive
+# evaluation of the States trees they are compiled from, on the state data of
+# random walks through each level as it is loaded back from the database: a
+# state path for the compiled tables, the nested data the recursive evaluation
+# takes as stored before state paths:
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.bench_level_states
+
+_LEVELS = {1: level_1.STATES, 2: level_2.STATES, 3: level_3.STATES}
+
+
+def _walk(states: States, conversations: int) -> tuple[list[Any], list[BaseData]]:
+    paths, nested = [], []
+    for _ in range(conversations):
+        data = states.init()
+        while data is not None:
+            paths.append(
+                StateActiveData.model_validate(
+                    StateActiveData(data=data).model_dump()
+                ).data
+            )
+            # nested data is loaded as dicts, which the recursive walk re-parses
+            nested.append(BaseData.model_validate(data.model_dump()))
+
+            state = states.next(data)
+            if isinstance(state, UserState):
+                data = random.choice(state.options).next
+            else:
+                data = state.next
+    return paths, nested
+
+
+def _time(states: States, steps: list[Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for data in steps:
+            states.next(data)
+    return (time.perf_counter() - started) / (repeat * len(steps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level state machine benchmark")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'level':>5} {'steps':>6} {'recursive':>11} {'compiled':>10} {'speedup':>8}"
+    )
+    for level, tree in _LEVELS.items():
+        compiled = get_level_states(LevelConversationStage(level=level))
+        paths, nested = _walk(compiled, args.conversations)
+
+        recursive_time = _time(tree, nested, args.repeat)
+        compiled_time = _time(compiled, paths, args.repeat)
+        print(
+            f"{level:>5} {len(paths):>6} {recursive_time * 1e6:>9.1f}us "
+            f"{compiled_time * 1e6:>8.1f}us {recursive_time / compiled_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import time
+from collections.abc import Callable
+
+from api.levels.all import get_level_states
+from api.levels.states import (
+    AgentState,
+    FeedbackState,
+    MessageInstructions,
+    UserState,
+)
+from api.schemas.conversation import LevelConversationStage
+from api.services import feedback_generation, message_generation
+
+# Measures the throughput of assembling the instruction and feedback example
+# parts of prompts for every state of each level, compiled on every call as
+# before they were cached, and from the cached templates:
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.bench_prompts
+
+_USER = "Alex"
+_AGENT = "Jordan"
+
+
+def _states(level: int) -> tuple[list[MessageInstructions], list[FeedbackState]]:
+    states = get_level_states(LevelConversationStage(level=level))
+    instructions, feedback = [], []
+    for id in range(len(states)):
+        match states.state(id):
+            case UserState(options=options):
+                instructions += [option.instructions for option in options]
+            case AgentState(instructions=agent_instructions):
+                instructions.append(agent_instructions)
+            case FeedbackState() as state:
+                feedback.append(state)
+    return instructions, feedback
+
+
+def _instructions(compiled: bool) -> Callable[[MessageInstructions], str]:
+    format = (
+        message_generation._format_instructions
+        if compiled
+        else message_generation._compile_instructions
+    )
+    return lambda instructions: format(instructions).format(user=_USER, agent=_AGENT)
+
+
+def _feedback(compiled: bool) -> Callable[[FeedbackState], str]:
+    def assemble(state: FeedbackState) -> str:
+        templates = (
+            feedback_generation._TEMPLATES.get(
+                state, feedback_generation._FeedbackTemplates
+            )
+            if compiled
+            else feedback_generation._FeedbackTemplates(state)
+        )
+        return feedback_generation._substitute_names(
+            templates.base_examples, _USER, _AGENT
+        )
+
+    return assemble
+
+
+def _throughput(assemble: Callable, items: list, repeat: int) -> float:
+    for item in items:
+        assemble(item)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            assemble(item)
+    return repeat * len(items) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt assembly benchmark")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(
+        f"{'level':>5} {'part':>12} {'per call/s':>12} {'cached/s':>12} {'speedup':>8}"
+    )
+    for level in (1, 2, 3):
+        instructions, feedback = _states(level)
+        for name, make, items in (
+            ("instructions", _instructions, instructions),
+            ("feedback", _feedback, feedback),
+        ):
+            uncached = _throughput(make(False), items, args.repeat)
+            cached = _throughput(make(True), items, args.repeat)
+            print(
+                f"{level:>5} {name:>12} {uncached:>12.0f} {cached:>12.0f} "
+                f"{cached / uncached:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
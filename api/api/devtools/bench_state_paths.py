@@ -0,0 +1,85 @@
+import argparse
+import random
+import time
+from typing import Any
+
+import bson
+
+from api.levels.all import get_level_states
+from api.levels.states import BaseData, UserState
+from api.schemas.conversation import (
+    LevelConversationStage,
+    MessageOption,
+    StateActiveData,
+    StateAwaitingUserChoiceData,
+    conversation_state_adapter,
+)
+
+# Compares the state data a step stores, as state paths and as the nested data
+# stored before them, by BSON size and by the time to parse it when loading:
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.bench_state_paths
+
+
+def _nested(data: BaseData | None) -> dict[str, Any] | None:
+    return None if data is None else data.model_dump()
+
+
+def _walk(level: int, conversations: int) -> list[tuple[dict, dict]]:
+    # the stored state after each step, as (state paths, nested data)
+    states = get_level_states(LevelConversationStage(level=level))
+    steps = []
+    for _ in range(conversations):
+        data = states.init()
+        while data is not None:
+            state = states.next(data)
+            if isinstance(state, UserState):
+                options = [
+                    MessageOption(response="", next=o.next) for o in state.options
+                ]
+                stored = StateAwaitingUserChoiceData(
+                    options=options, allow_custom=False
+                )
+                nested = {
+                    "type": "waiting",
+                    "options": [
+                        {"response": "", "next": _nested(o.next)} for o in state.options
+                    ],
+                    "allow_custom": False,
+                }
+                data = random.choice(state.options).next
+            else:
+                stored = StateActiveData(data=state.next)
+                nested = {"type": "active", "data": _nested(state.next)}
+                data = state.next
+            steps.append((conversation_state_adapter.dump_python(stored), nested))
+    return steps
+
+
+def _parse_time(documents: list[dict], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for document in documents:
+            conversation_state_adapter.validate_python(document)
+    return (time.perf_counter() - started) / (repeat * len(documents))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="State path storage benchmark")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'level':>5} {'':>7} {'bytes/step':>11} {'parse/step':>11}")
+    for level in (1, 2, 3):
+        steps = _walk(level, args.conversations)
+        for name, documents in zip(
+            ("paths", "nested"), zip(*steps, strict=True), strict=True
+        ):
+            size = sum(len(bson.encode(d)) for d in documents) / len(documents)
+            parse = _parse_time(list(documents), args.repeat)
+            print(f"{level:>5} {name:>7} {size:>11.0f} {parse * 1e6:>9.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import time
+from collections.abc import Iterator
+
+from api.levels import level_1, level_2, level_3
+from api.levels.states import (
+    ChainStates,
+    RepeatStates,
+    States,
+    UnionStates,
+    WithCtxStates,
+)
+
+# Times presenting the options of every UnionStates of each level, with the
+# options built on every visit as before they were memoized, and memoized:
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.bench_union_states
+
+_LEVELS = {1: level_1.STATES, 2: level_2.STATES, 3: level_3.STATES}
+
+
+def _unions(states: States) -> Iterator[UnionStates]:
+    match states:
+        case ChainStates():
+            for s in states.states:
+                yield from _unions(s)
+        case RepeatStates():
+            yield from _unions(states.state)
+        case WithCtxStates():
+            yield from _unions(states.states)
+        case UnionStates():
+            yield states
+
+
+def _time(union: UnionStates, repeat: int, memoized: bool) -> float:
+    data = union.init()
+    union.next(data)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if not memoized:
+            union._options = None
+        union.next(data)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    union._options = None
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UnionStates benchmark")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'level':>5} {'union':>5} {'built':>10} {'memoized':>10} {'speedup':>8}")
+    for level, tree in _LEVELS.items():
+        for i, union in enumerate(_unions(tree)):
+            built = _time(union, args.repeat, memoized=False)
+            memoized = _time(union, args.repeat, memoized=True)
+            print(
+                f"{level:>5} {i:>5} {built * 1e6:>8.1f}us {memoized * 1e6:>8.1f}us "
+                f"{built / memoized:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import sys
+
+from api.db import indexes
+
+# Creates the declared indexes and fails if any known query shape would scan a
+# whole collection:
+#
+#   MONGO_URI=... python -m api.devtools.check_indexes
+
+
+async def _run() -> int:
+    await indexes.ensure_indexes()
+    try:
+        await indexes.check_query_plans()
+    except indexes.CollectionScan as e:
+        logging.error(e)
+        return 1
+
+    logging.info("No query shape scans a whole collection")
+    return 0
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_run()))
+
+
+if __name__ == "__main__":
+    main()
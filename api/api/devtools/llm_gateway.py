@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from typing import Any, Literal
+
+import numpy as np
+import websockets as ws
+from pydantic import BaseModel, ConfigDict
+
+# A local stand-in for the LLM_URI websocket service. It speaks the same
+# runModel / extractEmbedding / extractEmbeddings protocol as services/llm.py and
+# answers with canned, schema-shaped JSON so the API can be load tested offline:
+#
+#   python -m api.devtools.llm_gateway --port 8765 --config gateway.json
+#   LLM_URI=ws://localhost:8765 uvicorn api.main:app
+
+
+class LatencyConfig(BaseModel):
+    distribution: Literal["constant", "uniform", "exponential", "lognormal"] = (
+        "lognormal"
+    )
+    median: float = 1.0
+    spread: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        match self.distribution:
+            case "constant":
+                return self.median
+            case "uniform":
+                return rng.uniform(
+                    max(0.0, self.median - self.spread), self.median + self.spread
+                )
+            case "exponential":
+                return rng.expovariate(1 / self.median) if self.median > 0 else 0.0
+            case "lognormal":
+                return self.median * rng.lognormvariate(0, self.spread)
+
+
+class ResponseRule(BaseModel):
+    # matched against the system prompt; named groups can be used in the response
+    pattern: str
+    response: Any
+
+
+class GatewayConfig(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    seed: int = 0
+    latency: LatencyConfig = LatencyConfig()
+    model_latency: dict[str, LatencyConfig] = {}
+    embedding_latency: LatencyConfig = LatencyConfig(
+        distribution="constant", median=0.05
+    )
+    error_rate: float = 0.0
+    drop_rate: float = 0.0
+    echo_request_id: bool = True
+    stream_chunk_size: int = 8
+    stream_chunk_delay: float = 0.02
+    embedding_dim: int = 256
+    rules: list[ResponseRule] = []
+
+
+DEFAULT_RULES = [
+    ResponseRule(
+        pattern=r"the key 'sender' with '(?P<sender>[^']+)' as the value",
+        response={
+            "sender": "{sender}",
+            "message": "That sounds great, tell me a bit more about it?",
+        },
+    ),
+    ResponseRule(
+        pattern=r"containing the title",
+        response={
+            "title": "💬 Be specific",
+            "body": "Your message could be read in more than one way. Say exactly "
+            "what you want to know so they can answer it directly.",
+        },
+    ),
+    ResponseRule(
+        pattern=r"'explanation'",
+        response={"explanation": "This says exactly what you want to know."},
+    ),
+    ResponseRule(
+        pattern=r"'user_perspective'",
+        response={
+            "user_perspective": "You met someone at a local club and want to join "
+            "their weekend hiking group.",
+            "agent_perspective": "You run a weekend hiking group and someone from "
+            "your local club messages you about it.",
+            "user_goal": "Find out more about the hiking group and ask to join.",
+            "is_user_initiated": True,
+        },
+    ),
+    ResponseRule(
+        pattern=r"notable figure in the field of (?P<topic>.+?)\. "
+        r".*Begin the description with 'You are (?P<name>[^.]+)\.\.\.'",
+        response={
+            "name": "{name}",
+            "age": "40-50",
+            "occupation": "Researcher",
+            "interests": ["{topic}"],
+            "description": "You are {name}, a well known expert in {topic}.",
+        },
+    ),
+    ResponseRule(
+        pattern=r"Generate a persona for (?P<name>.+?), an individual",
+        response={
+            "name": "{name}",
+            "age": "30-40",
+            "occupation": "Hiking guide",
+            "interests": ["hiking", "photography"],
+        },
+    ),
+    ResponseRule(
+        pattern=r"'persona'",
+        response={"persona": "You are a friendly person who texts casually."},
+    ),
+    ResponseRule(
+        pattern=r"'topic'",
+        response={"topic": "Hiking"},
+    ),
+    ResponseRule(
+        pattern=r'"age": "AGE RANGE"',
+        response={"age": "20-30", "occupation": "Student"},
+    ),
+    ResponseRule(
+        pattern=r"'culture'",
+        response={"culture": "American, casual and informal."},
+    ),
+    ResponseRule(
+        pattern=r"'writing_style'",
+        response={"writing_style": "Your writing style is short and casual."},
+    ),
+    ResponseRule(
+        pattern=r"'interests'",
+        response={"interests": ["hiking", "photography", "cooking"]},
+    ),
+]
+
+
+def _fill(template: Any, values: dict[str, str]) -> Any:
+    match template:
+        case str():
+            return template.format_map(_Defaulting(values))
+        case list():
+            return [_fill(item, values) for item in template]
+        case dict():
+            return {key: _fill(value, values) for key, value in template.items()}
+        case _:
+            return template
+
+
+class _Defaulting(dict):
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def embed_text(text: str, dim: int) -> list[float]:
+    digest = hashlib.sha256(text.encode()).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    vector = rng.standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class Gateway:
+    def __init__(self, config: GatewayConfig):
+        self.config = config
+        self.rules = [
+            (re.compile(rule.pattern, re.DOTALL), rule.response)
+            for rule in [*config.rules, *DEFAULT_RULES]
+        ]
+        self.rng = random.Random(config.seed)
+
+    def respond(self, system: str) -> str:
+        for pattern, response in self.rules:
+            if match := pattern.search(system):
+                filled = _fill(response, match.groupdict())
+                return filled if isinstance(filled, str) else json.dumps(filled)
+
+        return "OK"
+
+    def _latency(self, action: dict) -> float:
+        if action["action"] == "runModel":
+            config = self.config.model_latency.get(
+                action.get("model", ""), self.config.latency
+            )
+        else:
+            config = self.config.embedding_latency
+        return max(0.0, config.sample(self.rng))
+
+    async def handle(self, action: dict, send):
+        request_id = action.get("requestId") if self.config.echo_request_id else None
+
+        def frame(**data) -> str:
+            if request_id is not None:
+                data["requestId"] = request_id
+            return json.dumps(data)
+
+        roll = self.rng.random()
+        if roll < self.config.drop_rate:
+            return
+
+        await asyncio.sleep(self._latency(action))
+
+        if roll < self.config.drop_rate + self.config.error_rate:
+            # the real gateway does not tag errors with the request id
+            await send(json.dumps({"message": "Internal server error"}))
+            return
+
+        match action.get("action"):
+            case "runModel":
+                result = self.respond(action.get("system") or "")
+                if action.get("stream"):
+                    size = self.config.stream_chunk_size
+                    for i in range(0, len(result), size):
+                        await send(frame(delta=result[i : i + size]))
+                        await asyncio.sleep(self.config.stream_chunk_delay)
+                await send(frame(result=result))
+            case "extractEmbedding":
+                dim = self.config.embedding_dim
+                await send(frame(result=embed_text(action["prompt"], dim)))
+            case "extractEmbeddings":
+                dim = self.config.embedding_dim
+                result = [embed_text(text, dim) for text in action["prompts"]]
+                await send(frame(result=result))
+            case _:
+                await send(json.dumps({"message": "Forbidden"}))
+
+    async def serve_connection(self, conn: ws.WebSocketServerProtocol):
+        tasks = set()
+        async for raw in conn:
+            task = asyncio.create_task(self.handle(json.loads(raw), conn.send))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+async def serve(config: GatewayConfig, host: str, port: int):
+    gateway = Gateway(config)
+    async with ws.serve(gateway.serve_connection, host, port, max_size=None):
+        logging.info(f"LLM gateway stand-in listening on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local LLM gateway stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="path to a GatewayConfig JSON file")
+    args = parser.parse_args()
+
+    config = GatewayConfig()
+    if args.config:
+        with open(args.config) as f:
+            config = GatewayConfig.model_validate_json(f.read())
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(config, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from pydantic import BaseModel
+
+from api.services import llm
+
+# Fires concurrent generate() calls at LLM_URI (e.g. the llm_gateway stand-in)
+# and reports throughput and latency percentiles:
+#
+#   LLM_URI=ws://localhost:8765 python -m api.devtools.llm_load -n 500 -c 50
+
+
+class _Message(BaseModel):
+    sender: str
+    message: str
+
+
+async def _run(requests: int, concurrency: int, model: llm.Model):
+    system = (
+        "Respond with a JSON object containing the key 'message' with your message "
+        "as the value and the key 'sender' with 'Load' as the value."
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await llm.generate(_Message, model, f"request {i}", system)
+                latencies.append(time.monotonic() - started)
+            except Exception:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.monotonic() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0, 0, 0)
+    print(f"{requests} requests in {elapsed:.2f}s ({requests / elapsed:.1f} req/s)")
+    print(f"errors: {errors}")
+    print(f"latency p50={p50:.3f}s p95={p95:.3f}s p99={p99:.3f}s")
+    print(llm.pool_stats())
+    print(llm.limiter_stats()[model.vendor().value])
+
+    await llm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client load generator")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--model", choices=[m.name for m in llm.Model], default="CLAUDE_3_HAIKU"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(_run(args.requests, args.concurrency, llm.Model[args.model]))
+
+
+if __name__ == "__main__":
+    main()
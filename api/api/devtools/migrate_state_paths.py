@@ -0,0 +1,26 @@
+import asyncio
+import logging
+
+from api.db import conversations
+
+# Rewrites the state data of stored conversations from nested models to state
+# paths. Both are read, so this can run while the server is up:
+#
+#   MONGO_URI=... python -m api.devtools.migrate_state_paths
+
+
+async def _run():
+    migrated_conversations, migrated_entries = await conversations.migrate_state_paths()
+    logging.info(
+        f"Migrated {migrated_conversations} conversations and "
+        f"{migrated_entries} history entries"
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,18 @@ from api.schemas.conversation import (
 )
 
 from . import level_1, level_2, level_3
+from .compiled import CompiledStates
 from .seed import LevelConversationScenarioSeed
-from .states import States
 
+_LEVEL_STATES = {
+    1: CompiledStates(level_1.STATES),
+    2: CompiledStates(level_2.STATES),
+    3: CompiledStates(level_3.STATES),
+}
 
-def get_level_states(stage: LevelConversationStage) -> States:
-    level_states = {
-        1: level_1.STATES,
-        2: level_2.STATES,
-        3: level_3.STATES,
-    }
 
-    return level_states[stage.level]
+def get_level_states(stage: LevelConversationStage) -> CompiledStates:
+    return _LEVEL_STATES[stage.level]
 
 
 def get_base_level_scenario(
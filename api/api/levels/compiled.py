@@ -0,0 +1,291 @@
+import random
+from typing import Any
+
+from api.schemas.conversation import BaseData, state_path
+
+from .states import (
+    AgentState,
+    ChainStateData,
+    ChainStates,
+    FeedbackState,
+    RepeatStateData,
+    RepeatStates,
+    State,
+    States,
+    UnionStates,
+    UnionStatesData,
+    UserOption,
+    UserState,
+    WithCtxStates,
+    add_ctx,
+)
+
+# Flattens a tree of States into a table of every reachable state, indexed by
+# state path (see schemas.conversation.StatePath). Each entry holds its data,
+# the state next() returns for it and the ids of the entries its options lead
+# to, so next() is a lookup instead of a walk through every wrapper that
+# allocates and re-parses the nested data.
+
+
+# a stored state path that neither the compiled table nor the States tree it was
+# compiled from know, e.g. of a state removed from the level since
+class UnknownStatePath(ValueError):
+    pass
+
+
+class _Node:
+    def __init__(
+        self,
+        data: BaseData,
+        state: State,
+        targets: list[int | None],
+        sample_from: int | None = None,
+    ):
+        self.data = data
+        # the `next` fields are unused, the options lead to `targets` instead
+        self.state = state
+        # one per option, or a single one for agent and feedback states
+        self.targets = targets
+        # union states present the options before this index and a random
+        # sample of the rest
+        self.sample_from = sample_from
+
+
+class _Table:
+    def __init__(self, nodes: list[_Node], init: int):
+        self.nodes = nodes
+        self.init = init
+
+
+def _next_data(state: State) -> list[BaseData | None]:
+    if isinstance(state, UserState):
+        return [option.next for option in state.options]
+    return [state.next]
+
+
+def _embed(
+    table: _Table, wrap: type[BaseData], index: int, offset: int, exit: int | None
+) -> list[_Node]:
+    return [
+        _Node(
+            wrap(state=index, inner_data=node.data),
+            node.state,
+            [exit if target is None else target + offset for target in node.targets],
+            node.sample_from,
+        )
+        for node in table.nodes
+    ]
+
+
+def _compile_leaf(states: States[Any]) -> _Table:
+    nodes: list[_Node | None] = []
+    ids: dict[tuple[int | str, ...], int] = {}
+
+    def visit(data: BaseData) -> int:
+        if data.model_dump().keys() != {"state"}:
+            raise ValueError(f"Cannot compile state data with extra fields: {data}")
+
+        path = state_path(data)
+        if path in ids:
+            return ids[path]
+
+        id = ids[path] = len(nodes)
+        nodes.append(None)
+
+        state = states.next(data)
+        targets = [None if d is None else visit(d) for d in _next_data(state)]
+        nodes[id] = _Node(data, state, targets)
+        return id
+
+    init = visit(states.init())
+    return _Table([node for node in nodes if node is not None], init)
+
+
+def _compile_chain(states: ChainStates) -> _Table:
+    tables = [_compile(s) for s in states.states]
+    offsets = [0]
+    for table in tables:
+        offsets.append(offsets[-1] + len(table.nodes))
+
+    nodes = []
+    for i, table in enumerate(tables):
+        exit = offsets[i + 1] + tables[i + 1].init if i + 1 < len(tables) else None
+        nodes += _embed(table, ChainStateData, i, offsets[i], exit)
+
+    return _Table(nodes, tables[0].init)
+
+
+def _compile_repeat(states: RepeatStates) -> _Table:
+    table = _compile(states.state)
+    size = len(table.nodes)
+
+    nodes = []
+    for i in range(states.count):
+        exit = (i + 1) * size + table.init if i + 1 < states.count else None
+        nodes += _embed(table, RepeatStateData, i, i * size, exit)
+
+    return _Table(nodes, table.init)
+
+
+def _compile_union(states: UnionStates) -> _Table:
+    tables = [_compile(states.base_state), *(_compile(s) for s in states.states)]
+
+    nodes = []
+    options: list[UserOption] = []
+    targets: list[int | None] = []
+    sample_from = 0
+    for i, table in enumerate(tables):
+        offset = len(nodes)
+        nodes += _embed(table, UnionStatesData, i, offset, None)
+
+        init = table.nodes[table.init]
+        if not isinstance(init.state, UserState) or init.sample_from is not None:
+            raise ValueError("All states must be user states")
+
+        options += init.state.options
+        targets += [None if t is None else t + offset for t in init.targets]
+        if i == 0:
+            sample_from = len(options)
+
+    nodes.append(
+        _Node(
+            UnionStatesData(state=-1, inner_data=states.states[0].init()),
+            UserState(options=options),
+            targets,
+            sample_from,
+        )
+    )
+    return _Table(nodes, len(nodes) - 1)
+
+
+def _compile_with_ctx(states: WithCtxStates) -> _Table:
+    table = _compile(states.states)
+    nodes = [
+        _Node(
+            node.data,
+            add_ctx(node.state, states.user_ctx, states.agent_ctx),
+            node.targets,
+            node.sample_from,
+        )
+        for node in table.nodes
+    ]
+    return _Table(nodes, table.init)
+
+
+def _compile(states: States[Any]) -> _Table:
+    match states:
+        case ChainStates():
+            return _compile_chain(states)
+        case RepeatStates():
+            return _compile_repeat(states)
+        case UnionStates():
+            return _compile_union(states)
+        case WithCtxStates():
+            return _compile_with_ctx(states)
+        case _:
+            return _compile_leaf(states)
+
+
+def _link(node: _Node, nodes: list[_Node]) -> State:
+    def data(target: int | None) -> BaseData | None:
+        return None if target is None else nodes[target].data
+
+    match node.state:
+        case UserState(options=options):
+            return UserState(
+                options=[
+                    UserOption(instructions=option.instructions, next=data(target))
+                    for option, target in zip(options, node.targets, strict=True)
+                ]
+            )
+        case AgentState(instructions=instructions):
+            return AgentState(instructions=instructions, next=data(node.targets[0]))
+        case FeedbackState(prompt=prompt, examples=examples, follow_up=follow_up):
+            return FeedbackState(
+                prompt=prompt,
+                examples=examples,
+                follow_up=follow_up,
+                next=data(node.targets[0]),
+            )
+        case _:
+            raise ValueError(f"Could not link unknown state type: {node.state}")
+
+
+class CompiledStates(States[Any]):
+    def __init__(self, states: States[Any]):
+        self.states = states
+
+        table = _compile(states)
+        self._init_id = table.init
+        self._init = table.nodes[table.init].data
+        self._ids = {state_path(node.data): id for id, node in enumerate(table.nodes)}
+        assert len(self._ids) == len(table.nodes), "State paths must be unique"
+
+        self._states = [_link(node, table.nodes) for node in table.nodes]
+        self._targets = [node.targets for node in table.nodes]
+        self._sample_from = [node.sample_from for node in table.nodes]
+        self._choices: list[tuple[list[UserOption], list[UserOption]] | None] = [
+            None
+            if node.sample_from is None or not isinstance(state, UserState)
+            else (
+                state.options[: node.sample_from],
+                state.options[node.sample_from :],
+            )
+            for node, state in zip(table.nodes, self._states, strict=True)
+        ]
+
+    @property
+    def data_type(self):
+        return self.states.data_type
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @property
+    def init_id(self) -> int:
+        return self._init_id
+
+    # the state of an entry with every option, for union states before sampling
+    def state(self, id: int) -> State:
+        return self._states[id]
+
+    def targets(self, id: int) -> list[int | None]:
+        return self._targets[id]
+
+    def sample_from(self, id: int) -> int | None:
+        return self._sample_from[id]
+
+    def init(self) -> BaseData:
+        return self._init
+
+    # takes the path of a state as stored, or its data
+    def next(self, data: tuple[int | str, ...] | BaseData) -> State:
+        if isinstance(data, tuple):
+            id = self._ids.get(data)
+            if id is None:
+                # e.g. stored before the level was changed
+                return self._next_unknown(data)
+        else:
+            id = self._ids.get(state_path(data))
+            if id is None:
+                # e.g. data built before the level was changed
+                return self.states.next(data)
+
+        choices = self._choices[id]
+        if choices is None:
+            return self._states[id]
+
+        base, others = choices
+        return UserState(
+            options=base + random.sample(others, min(len(others), 3 - len(base)))
+        )
+
+    def _next_unknown(self, path: tuple[int | str, ...]) -> State:
+        try:
+            nested: dict[str, Any] = {"state": path[-1]}
+            for state in reversed(path[:-1]):
+                nested = {"state": state, "inner_data": nested}
+
+            return self.states.next(self.states.data_type(**nested))
+        except Exception as e:
+            raise UnknownStatePath(f"Unknown state path: {path}") from e
@@ -218,56 +218,80 @@ class UnionStates(States[UnionStatesData]):
         ), "All states must have the same init data"
         self._init_state: str = base_data.state
 
+        # options presented from the base's init data, memoized since that is
+        # where every union is entered
+        self._base_init = base_data
+        self._options: tuple[list[UserOption], list[UserOption]] | None = None
+
     def init(self) -> UnionStatesData:
         return UnionStatesData(state=-1, inner_data=self.states[0].init())
 
-    def next(self, data: UnionStatesData) -> State:
-        def wrap_next_with_index(
-            state_index: int,
-        ) -> Callable[[BaseData | None], UnionStatesData | None]:
-            def wrap_next(
-                wrap_data: BaseData | None,
-            ) -> UnionStatesData | None:
-                if wrap_data:
-                    return UnionStatesData(
-                        state=state_index,
-                        inner_data=wrap_data,
-                    )
-                else:
-                    return None
-
-            return wrap_next
+    @staticmethod
+    def _wrap_next_with_index(
+        state_index: int,
+    ) -> Callable[[BaseData | None], UnionStatesData | None]:
+        def wrap_next(
+            wrap_data: BaseData | None,
+        ) -> UnionStatesData | None:
+            if wrap_data:
+                return UnionStatesData(
+                    state=state_index,
+                    inner_data=wrap_data,
+                )
+            else:
+                return None
 
-        if data.state == -1:
-            inner_data: BaseData[Any] | dict = data.inner_data
-            # this may be parsed as a dict from JSON since it's nested.
-            if isinstance(inner_data, BaseModel):
-                inner_data = self.base_state.data_type(**inner_data.model_dump())
-            if isinstance(inner_data, dict):
-                inner_data = self.base_state.data_type(**inner_data)
-            base_state = self.base_state.next(inner_data)
-            all_states = [states.next(states.init()) for states in self.states]
-
-            if not all(
-                isinstance(state, UserState) for state in all_states
-            ) or not isinstance(base_state, UserState):
-                raise ValueError("All states must be user states")
-
-            wrapped_base = wrap_state_next(base_state, wrap_next_with_index(0))
-            wrapped_all = [
-                wrap_state_next(state, wrap_next_with_index(i + 1))
-                for i, state in enumerate(all_states)
-            ]
+        return wrap_next
 
-            assert isinstance(wrapped_base, UserState)
+    @staticmethod
+    def _inner_data(state: States[Any], inner_data: BaseData[Any] | dict) -> BaseData:
+        # this may be parsed as a dict from JSON since it's nested.
+        if isinstance(inner_data, BaseModel):
+            inner_data = state.data_type(**inner_data.model_dump())
+        if isinstance(inner_data, dict):
+            inner_data = state.data_type(**inner_data)
+        return inner_data
+
+    def _build_options(
+        self, base_data: BaseData
+    ) -> tuple[list[UserOption], list[UserOption]]:
+        base_state = self.base_state.next(base_data)
+        all_states = [states.next(states.init()) for states in self.states]
+
+        if not all(
+            isinstance(state, UserState) for state in all_states
+        ) or not isinstance(base_state, UserState):
+            raise ValueError("All states must be user states")
+
+        wrapped_base = wrap_state_next(base_state, self._wrap_next_with_index(0))
+        wrapped_all = [
+            wrap_state_next(state, self._wrap_next_with_index(i + 1))
+            for i, state in enumerate(all_states)
+        ]
+
+        assert isinstance(wrapped_base, UserState)
+
+        base_options = wrapped_base.options
+        other_options = [
+            option
+            for state in wrapped_all
+            if isinstance(state, UserState)
+            for option in state.options
+        ]
+
+        return base_options, other_options
 
-            base_options = wrapped_base.options
-            other_options = [
-                option
-                for state in wrapped_all
-                if isinstance(state, UserState)
-                for option in state.options
-            ]
+    def next(self, data: UnionStatesData) -> State:
+        if data.state == -1:
+            base_data = self._inner_data(self.base_state, data.inner_data)
+            # from the init data the options are the same on every visit and only
+            # the sample drawn from them differs
+            if base_data != self._base_init:
+                base_options, other_options = self._build_options(base_data)
+            else:
+                if self._options is None:
+                    self._options = self._build_options(base_data)
+                base_options, other_options = self._options
 
             options = base_options + random.sample(
                 other_options, min(len(other_options), 3 - len(base_options))
@@ -276,15 +300,9 @@ class UnionStates(States[UnionStatesData]):
             return UserState(options=options)
         else:
             state = self.states[data.state - 1] if data.state > 0 else self.base_state
-            inner_data: BaseData[Any] | dict = data.inner_data
-            # this may be parsed as a dict from JSON since it's nested.
-            if isinstance(inner_data, BaseModel):
-                inner_data = state.data_type(**inner_data.model_dump())
-            if isinstance(inner_data, dict):
-                inner_data = state.data_type(**inner_data)
-            next_data = state.next(inner_data)
+            next_data = state.next(self._inner_data(state, data.inner_data))
 
-            return wrap_state_next(next_data, wrap_next_with_index(data.state))
+            return wrap_state_next(next_data, self._wrap_next_with_index(data.state))
 
 
 class WithCtxStates(Generic[Data], States[Data]):
@@ -306,32 +324,33 @@ class WithCtxStates(Generic[Data], States[Data]):
         return self.states.init()
 
     def next(self, data: Data) -> State:
-        state = self.states.next(data)
-        if isinstance(state, UserState) and self.user_ctx:
-            return UserState(
-                options=[
-                    UserOption(
-                        instructions=MessageInstructions(
-                            description=option.instructions.description
-                            + " "
-                            + self.user_ctx,
-                            examples=option.instructions.examples,
-                        ),
-                        next=option.next,
-                    )
-                    for option in state.options
-                ]
-            )
-        elif isinstance(state, AgentState) and self.agent_ctx:
-            return AgentState(
-                instructions=MessageInstructions(
-                    description=f"{state.instructions.description} {self.agent_ctx}",
-                    examples=state.instructions.examples,
-                ),
-                next=state.next,
-            )
-        else:
-            return state
+        return add_ctx(self.states.next(data), self.user_ctx, self.agent_ctx)
+
+
+def add_ctx(state: State, user_ctx: str | None, agent_ctx: str | None) -> State:
+    if isinstance(state, UserState) and user_ctx:
+        return UserState(
+            options=[
+                UserOption(
+                    instructions=MessageInstructions(
+                        description=option.instructions.description + " " + user_ctx,
+                        examples=option.instructions.examples,
+                    ),
+                    next=option.next,
+                )
+                for option in state.options
+            ]
+        )
+    elif isinstance(state, AgentState) and agent_ctx:
+        return AgentState(
+            instructions=MessageInstructions(
+                description=f"{state.instructions.description} {agent_ctx}",
+                examples=state.instructions.examples,
+            ),
+            next=state.next,
+        )
+    else:
+        return state
 
 
 _UserNaturalProgressionId = Literal["user_natural"]
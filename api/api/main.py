@@ -1,16 +1,32 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from .routers import auth, conversations
+from .db import indexes
+from .routers import auth, conversations, metrics
+from .services import job_queue, llm
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 origins = ["http://localhost:3000", "https://autsim.pages.dev"]
 
-app = FastAPI(title="Autism Simulator API", version="0.0.1")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await indexes.ensure_indexes()
+    if indexes.CHECK_QUERY_PLANS:
+        await indexes.check_query_plans()
+    if job_queue.JOB_QUEUE_ENABLED:
+        job_queue.queue.start()
+    yield
+    await job_queue.queue.drain()
+    await llm.close()
+
+
+app = FastAPI(title="Autism Simulator API", version="0.0.1", lifespan=lifespan)
 
 
 app.add_middleware(
@@ -25,3 +41,4 @@ logger.debug(f"Allowed origins: {origins}")
 
 app.include_router(conversations.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
@@ -1,18 +1,25 @@
-from typing import Annotated
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Annotated, TypeVar
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 
 from api.auth.deps import CurrentInternalAuth, CurrentUser
 from api.schemas.conversation import (
     ConversationStage,
     ConversationStageStr,
+    ConversationStep,
     PregenerateOptions,
     SelectOption,
     conversation_stage_from_str,
 )
 from api.schemas.objectid import PyObjectId
-from api.services import conversation_handler
+from api.schemas.user import UserData
+from api.services import conversation_handler, idempotency
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
@@ -25,6 +32,43 @@ ConversationStageFromQuery = Annotated[
     ConversationStage, Depends(_get_conversation_stage)
 ]
 
+_conversation_adapter = TypeAdapter(conversation_handler.Conversation)
+_conversation_step_adapter: TypeAdapter[ConversationStep] = TypeAdapter(
+    ConversationStep
+)
+
+# retries carrying the same key replay the stored response instead of running the
+# request again
+IdempotencyKey = Annotated[str | None, Header(alias="Idempotency-Key")]
+
+_IDEMPOTENCY_RESPONSES = {
+    409: {"description": "Idempotency key is in use by a request still running"},
+    422: {"description": "Idempotency key was used for a different request"},
+}
+
+
+T = TypeVar("T")
+
+
+async def _run_idempotent(
+    current_user: UserData,
+    scope: str,
+    key: str | None,
+    request: str,
+    fn: Callable[[], Awaitable[T]],
+    adapter: TypeAdapter[T],
+) -> T:
+    try:
+        return await idempotency.run(current_user.id, scope, key, request, fn, adapter)
+    except idempotency.IdempotencyKeyInProgress as e:
+        raise HTTPException(
+            status_code=409, detail="Idempotency key is in use by a running request"
+        ) from e
+    except idempotency.IdempotencyKeyReused as e:
+        raise HTTPException(
+            status_code=422, detail="Idempotency key was used for a different request"
+        ) from e
+
 
 @router.post(
     "/",
@@ -32,19 +76,25 @@ ConversationStageFromQuery = Annotated[
     responses={
         400: {"description": "User not initialized"},
         401: {"description": "Stage not unlocked"},
+        **_IDEMPOTENCY_RESPONSES,
     },
 )
 async def create_conversation(
     current_user: CurrentUser,
     stage: ConversationStageFromQuery,
+    idempotency_key: IdempotencyKey = None,
 ) -> conversation_handler.Conversation:
     if not current_user.init:
         raise HTTPException(status_code=400, detail="User not initialized")
 
     try:
-        conversation = await conversation_handler.create_conversation(
+        conversation = await _run_idempotent(
             current_user,
-            stage,
+            "create",
+            idempotency_key,
+            str(stage),
+            lambda: conversation_handler.create_conversation(current_user, stage),
+            _conversation_adapter,
         )
     except conversation_handler.StageNotUnlocked as e:
         raise HTTPException(status_code=401, detail="Stage not unlocked") from e
@@ -74,18 +124,110 @@ async def get_conversation(
     return res
 
 
-@router.post("/{conversation_id}/next")
+@router.post(
+    "/{conversation_id}/next",
+    responses={
+        400: {"description": "Invalid selection"},
+        409: {"description": "Conversation was progressed concurrently"},
+        410: {"description": "Conversation's level has changed"},
+        **_IDEMPOTENCY_RESPONSES,
+    },
+)
 async def progress_conversation(
     current_user: CurrentUser,
     conversation_id: PyObjectId,
     option: SelectOption,
+    idempotency_key: IdempotencyKey = None,
 ) -> conversation_handler.ConversationStep:
     try:
-        return await conversation_handler.progress_conversation(
-            conversation_id, current_user, option
+        return await _run_idempotent(
+            current_user,
+            f"next:{conversation_id}",
+            idempotency_key,
+            option.model_dump_json(),
+            lambda: conversation_handler.progress_conversation(
+                conversation_id, current_user, option
+            ),
+            _conversation_step_adapter,
         )
     except conversation_handler.InvalidSelection as e:
         raise HTTPException(status_code=400, detail="Invalid selection") from e
+    except conversation_handler.ConversationConflict as e:
+        raise HTTPException(
+            status_code=409, detail="Conversation was progressed concurrently"
+        ) from e
+    except conversation_handler.ConversationOutdated as e:
+        raise HTTPException(
+            status_code=410, detail="Conversation's level has changed"
+        ) from e
+
+
+def _sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.post(
+    "/{conversation_id}/next/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def progress_conversation_stream(
+    current_user: CurrentUser,
+    conversation_id: PyObjectId,
+    option: SelectOption,
+) -> StreamingResponse:
+    # Server-sent events: `delta` events carry partial agent message text as it is
+    # generated, then a single `step` event carries the final ConversationStep
+    # (which is authoritative) or an `error` event.
+    events: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def on_agent_delta(text: str):
+        await events.put(_sse_event("delta", json.dumps({"text": text})))
+
+    async def progress():
+        try:
+            step = await conversation_handler.progress_conversation(
+                conversation_id, current_user, option, on_agent_delta=on_agent_delta
+            )
+            data = _conversation_step_adapter.dump_json(step).decode()
+            await events.put(_sse_event("step", data))
+        except conversation_handler.InvalidSelection:
+            await events.put(
+                _sse_event("error", json.dumps({"detail": "Invalid selection"}))
+            )
+        except conversation_handler.ConversationConflict:
+            await events.put(
+                _sse_event(
+                    "error",
+                    json.dumps({"detail": "Conversation was progressed concurrently"}),
+                )
+            )
+        except conversation_handler.ConversationOutdated:
+            await events.put(
+                _sse_event(
+                    "error", json.dumps({"detail": "Conversation's level has changed"})
+                )
+            )
+        except Exception:
+            # the response has already started, so it is reported in the stream
+            # and logged here rather than raised to the server
+            logging.exception("Could not progress conversation")
+            await events.put(
+                _sse_event("error", json.dumps({"detail": "Internal server error"}))
+            )
+        finally:
+            await events.put(None)
+
+    async def stream() -> AsyncIterator[str]:
+        task = asyncio.create_task(progress())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            # let the step finish and persist even if the client disconnects
+            await asyncio.shield(task)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
 
 
 @router.post("/pregenerate", status_code=204)
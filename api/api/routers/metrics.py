@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from api.auth.deps import CurrentInternalAuth
+from api.services import conversation_speculation, job_queue, llm
+from api.services.conversation_speculation import SpeculationStats
+from api.services.job_queue import JobQueueStats
+from api.services.llm_breaker import CircuitStats
+from api.services.llm_cache import CacheStats
+from api.services.llm_hedging import HedgeStats
+from api.services.llm_limiter import LimiterStats
+from api.services.llm_pool import PoolStats
+from api.services.llm_singleflight import SingleFlightStats
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+class LlmMetrics(BaseModel):
+    pool: PoolStats
+    cache: CacheStats
+    limiters: dict[str, LimiterStats]
+    singleflight: SingleFlightStats
+    hedging: HedgeStats
+    circuits: dict[str, CircuitStats]
+    speculation: SpeculationStats
+
+
+@router.get("/llm")
+async def llm_metrics(_: CurrentInternalAuth) -> LlmMetrics:
+    return LlmMetrics(
+        pool=llm.pool_stats(),
+        cache=llm.cache_stats(),
+        limiters=llm.limiter_stats(),
+        singleflight=llm.singleflight_stats(),
+        hedging=llm.hedge_stats(),
+        circuits=llm.breaker_stats(),
+        speculation=conversation_speculation.speculations.stats(),
+    )
+
+
+@router.get("/jobs")
+async def job_metrics(_: CurrentInternalAuth) -> JobQueueStats:
+    return job_queue.queue.stats()
@@ -1,11 +1,13 @@
-from typing import Annotated, Generic, Literal, Sequence, TypeVar
+from typing import Annotated, Any, Generic, Literal, Sequence, TypeVar
 
 from pydantic import (
     AfterValidator,
     BaseModel,
+    BeforeValidator,
     ConfigDict,
     Field,
-    SerializeAsAny,
+    PlainSerializer,
+    PrivateAttr,
     StringConstraints,
     TypeAdapter,
 )
@@ -24,7 +26,48 @@ class BaseData(BaseModel, Generic[StateId]):
     )
 
 
-StateData = TypeVar("StateData", bound=BaseData)
+# the `state` of each level of nesting of the data of the levels' state machines
+# identifies a state, so only that is stored: [STATE_PATH_VERSION, *path]. data
+# stored before is nested models of every combinator's data
+STATE_PATH_VERSION = 1
+
+
+def state_path(data: BaseData | dict[str, Any]) -> tuple[int | str, ...]:
+    path = []
+    node: Any = data
+    while node is not None:
+        if isinstance(node, dict):
+            path.append(node["state"])
+            node = node.get("inner_data")
+        else:
+            path.append(node.state)
+            node = getattr(node, "inner_data", None)
+    return tuple(path)
+
+
+def _decode_state_path(value: Any) -> Any:
+    match value:
+        case tuple():
+            return value
+        case [version, *path] if version == STATE_PATH_VERSION:
+            return tuple(path)
+        case list():
+            raise ValueError(f"Unknown state path version: {value[:1]}")
+        case BaseData() | dict():
+            return state_path(value)
+        case _:
+            return value
+
+
+def _encode_state_path(path: tuple[int | str, ...]) -> list[int | str]:
+    return [STATE_PATH_VERSION, *path]
+
+
+StatePath = Annotated[
+    tuple[int | str, ...],
+    BeforeValidator(_decode_state_path),
+    PlainSerializer(_encode_state_path),
+]
 
 
 class BaseFeedback(BaseModel):
@@ -82,9 +125,9 @@ def dump_message_list(
     )
 
 
-class MessageOption(BaseModel, Generic[StateData]):
+class MessageOption(BaseModel):
     response: str
-    next: SerializeAsAny[StateData] | None
+    next: StatePath | None
 
 
 class NpMessageOptionsLogEntry(BaseModel):
@@ -208,9 +251,9 @@ class StateAwaitingUserChoiceData(BaseModel):
     allow_custom: bool
 
 
-class StateActiveData(BaseModel, Generic[StateData]):
+class StateActiveData(BaseModel):
     type: Literal["active"] = "active"
-    data: SerializeAsAny[StateData] | None
+    data: StatePath | None
 
 
 class StateCompletedData(BaseModel):
@@ -222,14 +265,19 @@ ConversationStateData = Annotated[
     Field(discriminator="type"),
 ]
 
+conversation_state_adapter = TypeAdapter(ConversationStateData)
+
 
 class BaseConversation(BaseModel):
     user_id: PyObjectId
     info: ConversationInfo
     agent: AgentPersona
     state: ConversationStateData
-    events: list[ConversationLogEntry]
-    elements: list[ConversationElement]
+    # loaded conversations only hold the latest elements and no events, the full
+    # history is in a separate collection
+    events: list[ConversationLogEntry] = []
+    elements: list[ConversationElement] = []
+    version: int = 0
 
 
 class ConversationData(BaseConversation):
@@ -237,6 +285,24 @@ class ConversationData(BaseConversation):
 
     model_config = ConfigDict(populate_by_name=True)
 
+    # events and elements are append-only, so only what was added since the
+    # last load or save needs to be written
+    _stored_events: int = PrivateAttr(default=0)
+    _stored_elements: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any):
+        self.mark_stored()
+
+    def mark_stored(self):
+        self._stored_events = len(self.events)
+        self._stored_elements = len(self.elements)
+
+    def unstored(self, field: Literal["events", "elements"]) -> range | None:
+        stored = self._stored_events if field == "events" else self._stored_elements
+        current = len(getattr(self, field))
+        # None if the list was shortened and has to be rewritten
+        return range(stored, current) if current >= stored else None
+
 
 class StateAwaitingUserChoice(BaseModel):
     waiting: Literal[True] = True
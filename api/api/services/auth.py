@@ -53,8 +53,6 @@ async def create_magic_link(qa_id: UUID) -> str:
         persona = await generate_user_info(qa_id)
         user = await users.create(BaseUserData(qa_id=qa_id, persona=persona))
 
-        await pregenerate_initial_conversations(user)
-
     link = magic_links.MagicLink(secret=secret, user_id=user.id)
     await magic_links.create(link)
     return link.secret
@@ -76,4 +74,9 @@ async def init_user(user_id: ObjectId, name: str) -> UserData:
     user.persona.name = name
     user.init = True
 
-    return await users.update(user_id, user)
+    user = await users.update(user_id, user)
+
+    # warmed conversations are built for the final persona, which needs the name
+    await pregenerate_initial_conversations(user)
+
+    return user
@@ -110,6 +110,7 @@ async def _generate_agent_base(scenario, name):
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=scenario,
+        cache=True,
     )
 
     return response
@@ -139,6 +140,7 @@ async def _generate_agent_persona_from_base(agent: AgentBasePersona, culture: st
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=prompt_data,
+        cache=True,
     )
 
     return AgentPersona(
@@ -205,4 +207,5 @@ async def generate_agent_persona_from_topic(name: str, topic: str) -> AgentPerso
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=topic,
+        cache=True,
     )
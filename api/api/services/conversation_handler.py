@@ -1,14 +1,19 @@
 import asyncio
+import functools
 import random
+from collections.abc import Awaitable, Callable
 
 import faker
 from bson import ObjectId
 
 from api.db import conversations, users
 from api.levels.all import get_level_states
+from api.levels.compiled import UnknownStatePath
 from api.levels.states import (
     AgentState,
     FeedbackState,
+    State,
+    States,
     UserState,
 )
 from api.schemas.conversation import (
@@ -18,9 +23,11 @@ from api.schemas.conversation import (
     BaseConversation,
     CompletedStep,
     Conversation,
+    ConversationData,
     ConversationDescriptor,
     ConversationStage,
     ConversationStep,
+    Feedback,
     FeedbackElement,
     FeedbackLogEntry,
     FeedbackStep,
@@ -34,6 +41,7 @@ from api.schemas.conversation import (
     PlaygroundConversationInfo,
     PlaygroundConversationScenario,
     PlaygroundConversationStage,
+    PregenerateOptions,
     SelectOption,
     SelectOptionIndex,
     SelectOptionNone,
@@ -44,12 +52,19 @@ from api.schemas.conversation import (
 )
 from api.schemas.user import UserData
 
-from . import conversation_pregen
+from . import (
+    conversation_pool,
+    conversation_pregen,
+    conversation_speculation,
+    job_queue,
+    llm,
+)
 from .conversation_generation import (
     generate_agent_persona,
     generate_level_conversation_scenario,
 )
 from .feedback_generation import generate_feedback
+from .llm_singleflight import SingleFlight
 from .message_generation import generate_message
 
 
@@ -87,21 +102,25 @@ async def create_conversation(
     if not _is_unlocked_stage(stage, user.max_unlocked_stage):
         raise StageNotUnlocked()
 
-    # if isinstance(stage, LevelConversationStage):
-    #     conversation = await conversations.query_one(user.id, stage)
-    #     if conversation is not None:
-    #         return Conversation.from_data(conversation)
+    data = await conversation_pool.claim(user, stage)
+    if data is None:
+        data = await _build_conversation(user, stage)
+    else:
+        # only replace what was used, a miss is already paid for inline
+        conversation_pool.schedule_fill(user, stage, _build_conversation)
 
-    return await _create_conversation_internal(user, stage)
+    conversation = await conversations.insert(data)
+
+    return Conversation.from_data(conversation)
 
 
 fake = faker.Faker()
 
 
-async def _create_conversation_internal(
+async def _build_conversation(
     user: UserData,
     stage: ConversationStage,
-) -> Conversation:
+) -> BaseConversation:
     assert isinstance(stage, LevelConversationStage)
     agent_name = fake.first_name()
     states = get_level_states(stage)
@@ -151,7 +170,7 @@ async def _create_conversation_internal(
             )
             state = StateActiveData(data=states.init())
 
-    data = BaseConversation(
+    return BaseConversation(
         user_id=user.id,
         info=info,
         agent=agent,
@@ -160,10 +179,6 @@ async def _create_conversation_internal(
         events=[],
     )
 
-    conversation = await conversations.insert(data)
-
-    return Conversation.from_data(conversation)
-
 
 async def list_conversations(user_id: ObjectId, options: ConversationStage):
     convs = await conversations.query(user_id, options)
@@ -174,21 +189,53 @@ async def get_conversation(
     conversation_id: ObjectId, user_id: ObjectId
 ) -> Conversation | None:
     conversation = await conversations.get(conversation_id, user_id)
-    return Conversation.from_data(conversation) if conversation else None
+    if not conversation:
+        return None
+
+    conversation.elements = await conversations.get_elements(conversation.id)
+    return Conversation.from_data(conversation)
 
 
 class InvalidSelection(Exception):
     pass
 
 
+class ConversationConflict(Exception):
+    pass
+
+
+# the conversation is at a state its level no longer has
+class ConversationOutdated(Exception):
+    pass
+
+
 async def unlock_stage(user: UserData, stage: ConversationStage):
     await users.unlock_stage(user.id, stage)
 
 
+_PROGRESSIONS = SingleFlight()
+
+
 async def progress_conversation(
     conversation_id: ObjectId,
     user: UserData,
     option: SelectOption,
+    on_agent_delta: Callable[[str], Awaitable[None]] | None = None,
+) -> ConversationStep:
+    # duplicate requests (double clicks, retries) share one progression
+    key = f"{user.id}:{conversation_id}:{option.model_dump_json()}"
+    step, _ = await _PROGRESSIONS.do(
+        key,
+        lambda: _progress_conversation(conversation_id, user, option, on_agent_delta),
+    )
+    return step
+
+
+async def _progress_conversation(
+    conversation_id: ObjectId,
+    user: UserData,
+    option: SelectOption,
+    on_agent_delta: Callable[[str], Awaitable[None]] | None,
 ) -> ConversationStep:
     conversation = await conversations.get(conversation_id, user.id)
 
@@ -199,6 +246,7 @@ async def progress_conversation(
     states = get_level_states(conversation.info)
 
     unlocked_stage = user.max_unlocked_stage
+    speculated = None
 
     if isinstance(conversation.state, StateAwaitingUserChoiceData):
         match option:
@@ -209,6 +257,11 @@ async def progress_conversation(
             case _:
                 raise InvalidSelection()
 
+        if conversation_speculation.SPECULATIVE_GENERATION:
+            speculated = await conversation_speculation.speculations.take(
+                str(conversation.id), _speculation_branch(index, response)
+            )
+
         conversation.events.append(
             NpMessageSelectedLogEntry(
                 message=response.response,
@@ -243,7 +296,14 @@ async def progress_conversation(
 
             result = CompletedStep(max_unlocked_stage=str(unlocked_stage))
         else:
-            state_data = states.next(conversation.state.data)
+            try:
+                state_data = (
+                    speculated[0]
+                    if speculated is not None
+                    else states.next(conversation.state.data)
+                )
+            except UnknownStatePath as e:
+                raise ConversationOutdated() from e
 
             if isinstance(state_data, UserState):
                 state_options = (
@@ -286,20 +346,29 @@ async def progress_conversation(
                     options=options, allow_custom=False
                 )
 
+                if conversation_speculation.SPECULATIVE_GENERATION:
+                    _speculate_next_steps(states, conversation, user, options)
+
                 result = NpMessageStep(
                     options=[o.response for o in options],
                     allow_custom=False,
                     max_unlocked_stage=str(unlocked_stage),
                 )
             elif isinstance(state_data, AgentState):
-                response = await generate_message(
-                    user_sent=False,
-                    user=user.persona,
-                    agent=conversation.agent,
-                    messages=messages,
-                    scenario=conversation.info.scenario,
-                    instructions=state_data.instructions,
-                )
+                if speculated is not None:
+                    response = speculated[1]
+                    if on_agent_delta is not None:
+                        await on_agent_delta(response)
+                else:
+                    response = await generate_message(
+                        user_sent=False,
+                        user=user.persona,
+                        agent=conversation.agent,
+                        messages=messages,
+                        scenario=conversation.info.scenario,
+                        instructions=state_data.instructions,
+                        on_delta=on_agent_delta,
+                    )
 
                 conversation.events.append(
                     ApMessageLogEntry(
@@ -317,10 +386,14 @@ async def progress_conversation(
                     content=response, max_unlocked_stage=str(unlocked_stage)
                 )
             elif isinstance(state_data, FeedbackState):
-                response = await generate_feedback(
-                    user.persona,
-                    conversation,
-                    state_data,
+                response = (
+                    speculated[1]
+                    if speculated is not None
+                    else await generate_feedback(
+                        user.persona,
+                        conversation,
+                        state_data,
+                    )
                 )
 
                 conversation.events.append(
@@ -343,6 +416,9 @@ async def progress_conversation(
                             conversation.info, PlaygroundConversationInfo
                         ),
                     )
+
+                    if conversation_speculation.SPECULATIVE_GENERATION:
+                        _speculate_next_steps(states, conversation, user, options)
                 else:
                     conversation.state = StateActiveData(data=state_data.next)
 
@@ -362,36 +438,101 @@ async def progress_conversation(
     else:
         raise RuntimeError(f"Invalid state: {conversation.state}")
 
-    await conversations.update(conversation)
+    try:
+        await conversations.update(conversation)
+    except conversations.VersionConflict as e:
+        raise ConversationConflict() from e
 
     return result
 
 
+def _speculate_next_steps(
+    states: States,
+    conversation: ConversationData,
+    user: UserData,
+    options: list[MessageOption],
+):
+    branches = {}
+    for index, option in enumerate(options):
+        if option.next is None:
+            continue
+
+        # the next state is picked now so a hit replays exactly what was generated
+        try:
+            state_data = states.next(option.next)
+        except UnknownStatePath:
+            continue
+        if not isinstance(state_data, AgentState | FeedbackState):
+            continue
+
+        speculative = conversation.model_copy(
+            update={
+                "elements": [
+                    *conversation.elements,
+                    MessageElement(content=UserMessage(message=option.response)),
+                ]
+            }
+        )
+        branches[_speculation_branch(index, option)] = functools.partial(
+            _speculate_step, user, speculative, state_data
+        )
+
+    if branches:
+        conversation_speculation.speculations.start(str(conversation.id), branches)
+
+
+def _speculation_branch(index: int, option: MessageOption) -> str:
+    return f"{index}:{option.response}"
+
+
+async def _speculate_step(
+    user: UserData, conversation: ConversationData, state_data: State
+) -> tuple[State, str | Feedback]:
+    if isinstance(state_data, AgentState):
+        messages = [
+            elem.content
+            for elem in conversation.elements
+            if isinstance(elem, MessageElement)
+        ]
+        response = await generate_message(
+            user_sent=False,
+            user=user.persona,
+            agent=conversation.agent,
+            messages=messages,
+            scenario=conversation.info.scenario,
+            instructions=state_data.instructions,
+        )
+    else:
+        response = await generate_feedback(user.persona, conversation, state_data)
+
+    return state_data, response
+
+
 async def pregenerate_conversation(user_id: ObjectId, stage: ConversationStage):
+    with llm.priority_scope(llm.Priority.PREGENERATION):
+        await _pregenerate_conversation(user_id, stage)
+
+
+async def _pregenerate_conversation(user_id: ObjectId, stage: ConversationStage):
     user = await users.get(user_id)
     if not user:
         raise RuntimeError("User not found")
 
-    conversation = await conversations.query_one(user.id, stage)
-    if conversation is not None:
-        return
+    await conversation_pool.fill(user, stage, _build_conversation)
 
-    conversation = await _create_conversation_internal(user, stage)
 
-    step = None
-    while isinstance(step, ApMessageStep):
-        step = await progress_conversation(
-            conversation.id,
-            user,
-            SelectOptionNone(),
-        )
+async def _run_pregenerate_job(payload: dict):
+    options = PregenerateOptions.model_validate(payload)
+    await pregenerate_conversation(options.user_id, options.stage)
+
+
+job_queue.queue.register(conversation_pregen.PREGENERATE_JOB, _run_pregenerate_job)
 
 
 async def _enqueue_pregenerate_conversation_ifne(
     user: UserData, stage: ConversationStage
 ):
-    conversation = await conversations.query_one(user.id, stage)
-    if not conversation:
+    if await conversation_pool.needs_fill(user, stage):
         if conversation_pregen.DEFER_PREGENERATION:
             await conversation_pregen.create_pregenerate_task(user.id, stage)
         else:
@@ -414,5 +555,5 @@ async def _enqueue_pregenerate_conversations(user: UserData):
 
 
 async def pregenerate_initial_conversations(user: UserData):
-    await pregenerate_conversation(user.id, LevelConversationStage(level=1))
+    await _enqueue_pregenerate_conversation_ifne(user, LevelConversationStage(level=1))
     await _enqueue_pregenerate_conversations(user)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+
+from api.db import warm_conversations
+from api.schemas.conversation import BaseConversation, ConversationStage
+from api.schemas.user import UserData
+
+from . import llm
+
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", "0"))
+WARM_POOL_TTL = float(os.environ.get("WARM_POOL_TTL", str(24 * 60 * 60)))
+WARM_POOL_FILL_LEASE = 600
+
+ConversationBuilder = Callable[
+    [UserData, ConversationStage], Awaitable[BaseConversation]
+]
+
+_tasks: set[asyncio.Task] = set()
+
+
+def _fingerprint(user: UserData) -> str:
+    # scenarios are written for the persona, so a changed persona (e.g. the name
+    # being set on init) invalidates everything built before it
+    return hashlib.sha256(user.persona.model_dump_json().encode()).hexdigest()
+
+
+def _fresh_after() -> datetime:
+    return datetime.now(UTC) - timedelta(seconds=WARM_POOL_TTL)
+
+
+async def claim(user: UserData, stage: ConversationStage) -> BaseConversation | None:
+    if WARM_POOL_SIZE <= 0:
+        return None
+
+    return await warm_conversations.pop(
+        user.id, stage, _fingerprint(user), _fresh_after()
+    )
+
+
+async def needs_fill(user: UserData, stage: ConversationStage) -> bool:
+    if WARM_POOL_SIZE <= 0:
+        return False
+
+    ready = await warm_conversations.count(
+        user.id, stage, _fingerprint(user), _fresh_after()
+    )
+    return ready < WARM_POOL_SIZE
+
+
+async def fill(user: UserData, stage: ConversationStage, build: ConversationBuilder):
+    if WARM_POOL_SIZE <= 0:
+        return
+
+    leased_until = await warm_conversations.lock_fill(
+        user.id, stage, WARM_POOL_FILL_LEASE
+    )
+    if leased_until is None:
+        return
+
+    try:
+        fingerprint = _fingerprint(user)
+        fresh_after = _fresh_after()
+
+        await warm_conversations.prune(user.id, stage, fingerprint, fresh_after)
+
+        # recount after each round, conversations may be claimed while building
+        while (
+            ready := await warm_conversations.count(
+                user.id, stage, fingerprint, fresh_after
+            )
+        ) < WARM_POOL_SIZE:
+            with llm.priority_scope(llm.Priority.PREGENERATION):
+                built = await asyncio.gather(
+                    *[build(user, stage) for _ in range(WARM_POOL_SIZE - ready)],
+                    return_exceptions=True,
+                )
+
+            failed = 0
+            for conversation in built:
+                if isinstance(conversation, BaseException):
+                    logging.warning(
+                        f"Could not build warm conversation: {conversation}"
+                    )
+                    failed += 1
+                    continue
+                await warm_conversations.push(
+                    user.id,
+                    stage,
+                    fingerprint,
+                    conversation,
+                    datetime.now(UTC) + timedelta(seconds=WARM_POOL_TTL),
+                )
+
+            if failed:
+                break
+    finally:
+        await warm_conversations.unlock_fill(user.id, stage, leased_until)
+
+
+def schedule_fill(user: UserData, stage: ConversationStage, build: ConversationBuilder):
+    if WARM_POOL_SIZE <= 0:
+        return
+
+    task = asyncio.create_task(fill(user, stage, build))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
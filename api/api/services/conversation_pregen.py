@@ -9,6 +9,8 @@ from google.protobuf import timestamp_pb2
 
 from api.schemas.conversation import ConversationStage, PregenerateOptions
 
+from . import job_queue
+
 _SELF_URI = os.getenv("SELF_URI", "")
 _GCP_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT", "")
 _GCP_LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "")
@@ -16,17 +18,24 @@ _GCP_QUEUE = os.getenv("GOOGLE_CLOUD_QUEUE", "")
 
 _INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
 
-DEFER_PREGENERATION = bool(_SELF_URI and _GCP_PROJECT and _GCP_LOCATION and _GCP_QUEUE)
+_USE_CLOUD_TASKS = bool(_SELF_URI and _GCP_PROJECT and _GCP_LOCATION and _GCP_QUEUE)
 
+DEFER_PREGENERATION = _USE_CLOUD_TASKS or job_queue.JOB_QUEUE_ENABLED
 
-async def create_pregenerate_task(user_id: ObjectId, stage: ConversationStage) -> None:
-    client = tasks_v2.CloudTasksAsyncClient()
+PREGENERATE_JOB = "pregenerate"
 
-    name = client.task_path(
-        _GCP_PROJECT, _GCP_LOCATION, _GCP_QUEUE, f"{str(user_id)}_{str(stage)}"
-    )
 
+async def create_pregenerate_task(user_id: ObjectId, stage: ConversationStage) -> None:
     options = PregenerateOptions(user_id=user_id, stage=stage)
+    task_id = f"{str(user_id)}_{str(stage)}"
+
+    if not _USE_CLOUD_TASKS:
+        await job_queue.queue.enqueue(task_id, PREGENERATE_JOB, options.model_dump())
+        return
+
+    client = tasks_v2.CloudTasksAsyncClient()
+
+    name = client.task_path(_GCP_PROJECT, _GCP_LOCATION, _GCP_QUEUE, task_id)
 
     task = tasks_v2.Task(
         http_request=tasks_v2.HttpRequest(
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel
+
+from . import llm
+
+SPECULATIVE_GENERATION = os.environ.get("SPECULATIVE_GENERATION", "0") == "1"
+SPECULATION_TTL = float(os.environ.get("SPECULATION_TTL", "900"))
+
+T = TypeVar("T")
+
+
+class SpeculationStats(BaseModel):
+    pending: int
+    speculated: int
+    hits: int
+    misses: int
+    cancelled: int
+    wasted: int
+    wasted_tokens: int
+    hit_rate: float | None
+
+
+class _Branch(Generic[T]):
+    def __init__(
+        self, task: asyncio.Task[T], usage: llm.Usage, priority: llm.PriorityScope
+    ):
+        self.task = task
+        self.usage = usage
+        self.priority = priority
+
+
+class Speculator(Generic[T]):
+    def __init__(self, ttl: float = SPECULATION_TTL):
+        self.ttl = ttl
+
+        self._pending: dict[str, dict[str, _Branch[T]]] = {}
+        self._expiry: dict[str, asyncio.TimerHandle] = {}
+
+        self._speculated = 0
+        self._hits = 0
+        self._misses = 0
+        self._cancelled = 0
+        self._wasted = 0
+        self._wasted_tokens = 0
+
+    # starts every branch in the background; only one of them is expected to be
+    # taken, the rest are cancelled when it is
+    def start(self, key: str, branches: dict[str, Callable[[], Awaitable[T]]]):
+        self.discard(key)
+
+        started: dict[str, _Branch[T]] = {}
+        for branch_key, fn in branches.items():
+            with (
+                llm.usage_scope() as usage,
+                llm.priority_scope(llm.Priority.PREGENERATION) as priority,
+            ):
+                task = asyncio.ensure_future(fn())
+            started[branch_key] = _Branch(task, usage, priority)
+
+        self._speculated += len(started)
+        self._pending[key] = started
+        self._expiry[key] = asyncio.get_running_loop().call_later(
+            self.ttl, self.discard, key
+        )
+
+    async def take(self, key: str, branch_key: str) -> T | None:
+        branches = self._pop(key)
+        if branches is None:
+            return None
+
+        branch = branches.pop(branch_key, None)
+        self._abandon(branches.values())
+
+        if branch is None:
+            self._misses += 1
+            return None
+
+        # a request is now waiting on the branch
+        branch.priority.raise_to(llm.Priority.INTERACTIVE)
+        try:
+            result = await branch.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Speculative generation failed: {e}")
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        return result
+
+    def discard(self, key: str):
+        branches = self._pop(key)
+        if branches is not None:
+            self._abandon(branches.values())
+
+    def _pop(self, key: str) -> dict[str, _Branch[T]] | None:
+        if expiry := self._expiry.pop(key, None):
+            expiry.cancel()
+        return self._pending.pop(key, None)
+
+    def _abandon(self, branches: Iterable[_Branch[T]]):
+        for branch in branches:
+            if branch.task.done():
+                self._wasted += 1
+                self._wasted_tokens += branch.usage.tokens
+                if not branch.task.cancelled():
+                    branch.task.exception()
+            else:
+                self._cancelled += 1
+                branch.task.cancel()
+
+                # calls already sent still count once the task unwinds
+                def count(_, usage=branch.usage):
+                    self._wasted_tokens += usage.tokens
+
+                branch.task.add_done_callback(count)
+
+    def stats(self) -> SpeculationStats:
+        resolved = self._hits + self._misses
+        return SpeculationStats(
+            pending=len(self._pending),
+            speculated=self._speculated,
+            hits=self._hits,
+            misses=self._misses,
+            cancelled=self._cancelled,
+            wasted=self._wasted,
+            wasted_tokens=self._wasted_tokens,
+            hit_rate=self._hits / resolved if resolved else None,
+        )
+
+
+speculations: Speculator[Any] = Speculator()
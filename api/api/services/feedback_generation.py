@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 from api.levels.states import FeedbackState, MessageInstructions
 from api.schemas.conversation import (
@@ -12,8 +12,19 @@ from api.schemas.conversation import (
 from api.schemas.persona import AgentPersona, UserPersona
 
 from . import llm
+from .identity_cache import IdentityCache
 from .message_generation import generate_message
 
+FEEDBACK_MODEL = llm.Model.GPT_4
+
+# stand-ins for the names in compiled examples, substituted per call; private use
+# characters can't clash with the examples' text and aren't escaped in JSON
+_USER_NAME = "\ue000"
+_AGENT_NAME = "\ue001"
+_AGENT_NAME_JSON = "\ue002"
+
+_str_adapter = TypeAdapter(str)
+
 
 def _extract_messages_for_feedback(conversation: ConversationData):
     messages = [
@@ -61,26 +72,57 @@ def _extract_explanation_examples(
     ]
 
 
-async def generate_feedback_base(
-    user: UserPersona,
-    conversation: ConversationData,
-    prompt: str,
+def _compile_feedback_base_examples(
     examples: list[tuple[list[Message], BaseFeedback]],
-) -> BaseFeedback:
-    agent = conversation.agent
-    messages = _extract_messages_for_feedback(conversation)
-
-    examples_str = "\n\n".join(
+) -> str:
+    return "\n\n".join(
         [
-            dump_message_list(messages, user.name, agent.name)
+            dump_message_list(messages, _USER_NAME, _AGENT_NAME)
             + "\n"
             + BaseFeedback(
-                title=fb.title, body=fb.body.format(agent=agent.name)
+                title=fb.title, body=fb.body.format(agent=_AGENT_NAME_JSON)
             ).model_dump_json()
             for messages, fb in examples
         ]
     )
 
+
+def _substitute_names(template: str, user: str | None, agent: str) -> str:
+    return (
+        template.replace(_USER_NAME, user or "User")
+        .replace(_AGENT_NAME, agent)
+        .replace(_AGENT_NAME_JSON, _str_adapter.dump_json(agent).decode()[1:-1])
+    )
+
+
+class _FeedbackTemplates:
+    def __init__(self, state: FeedbackState):
+        self.base_examples = _compile_feedback_base_examples(
+            _extract_feedback_base_examples(state.examples)
+        )
+        self.follow_up = MessageInstructions(
+            description=state.follow_up,
+            examples=_extract_follow_up_examples(state.examples),
+        )
+        self.explanation_examples = _extract_explanation_examples(state.examples)
+
+
+# feedback states come from the levels' state tables and are reused by every
+# call for the same state
+_TEMPLATES: IdentityCache[FeedbackState, _FeedbackTemplates] = IdentityCache()
+
+
+async def generate_feedback_base(
+    user: UserPersona,
+    conversation: ConversationData,
+    prompt: str,
+    examples: str,
+) -> BaseFeedback:
+    agent = conversation.agent
+    messages = _extract_messages_for_feedback(conversation)
+
+    examples_str = _substitute_names(examples, user.name, agent.name)
+
     system_prompt = (
         "You are a social skills coach. Your task is to provide feedback on the "
         f"ongoing conversation between the user and {agent.name}, who is an autistic "
@@ -104,7 +146,7 @@ async def generate_feedback_base(
 
     return await llm.generate(
         schema=BaseFeedback,
-        model=llm.Model.GPT_4,
+        model=FEEDBACK_MODEL,
         system=system_prompt,
         prompt=prompt_data,
     )
@@ -174,7 +216,7 @@ async def _generate_follow_up_explanation(
 
     response = await llm.generate(
         schema=FeedbackExplanation,
-        model=llm.Model.GPT_4,
+        model=FEEDBACK_MODEL,
         system=system_prompt,
         prompt=prompt_data,
     )
@@ -191,11 +233,13 @@ async def generate_feedback(
         if isinstance(elem, MessageElement)
     ]
 
+    templates = _TEMPLATES.get(state, _FeedbackTemplates)
+
     base = await generate_feedback_base(
         user,
         conversation,
         state.prompt,
-        examples=_extract_feedback_base_examples(state.examples),
+        examples=templates.base_examples,
     )
 
     follow_up = await generate_message(
@@ -204,10 +248,7 @@ async def generate_feedback(
         agent=conversation.agent,
         messages=all_messages,
         scenario=conversation.info.scenario,
-        instructions=MessageInstructions(
-            description=state.follow_up,
-            examples=_extract_follow_up_examples(state.examples),
-        ),
+        instructions=templates.follow_up,
         feedback=base.body,
     )
 
@@ -216,7 +257,7 @@ async def generate_feedback(
         conversation,
         base,
         follow_up,
-        _extract_explanation_examples(state.examples),
+        templates.explanation_examples,
     )
 
     return Feedback(
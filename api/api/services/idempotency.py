@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import os
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import TypeVar
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from api.db import idempotency_keys
+from api.db.idempotency_keys import IdempotencyRecord
+
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+
+# how long a pending key blocks retries before it is assumed abandoned
+_LOCK_TIMEOUT = 300
+_POLL_INTERVAL = 0.5
+
+T = TypeVar("T")
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class IdempotencyKeyInProgress(Exception):
+    pass
+
+
+async def run(
+    user_id: ObjectId,
+    scope: str,
+    key: str | None,
+    request: str,
+    fn: Callable[[], Awaitable[T]],
+    adapter: TypeAdapter[T],
+) -> T:
+    if key is None:
+        return await fn()
+
+    id = f"{user_id}:{scope}:{key}"
+    fingerprint = hashlib.sha256(request.encode()).hexdigest()
+
+    while True:
+        now = datetime.now(UTC)
+        record = IdempotencyRecord(
+            id=id,
+            fingerprint=fingerprint,
+            status="pending",
+            locked_until=now + timedelta(seconds=_LOCK_TIMEOUT),
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL),
+        )
+
+        existing = await idempotency_keys.claim(record)
+        if existing is None:
+            break
+
+        if existing.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+
+        done = await _wait(existing)
+        if done is not None:
+            assert done.response is not None
+            return adapter.validate_json(done.response)
+        # the original request failed, claim the key to run it again
+
+    try:
+        response = await fn()
+    except BaseException:
+        # failed requests are not recorded, so a retry runs them again
+        await asyncio.shield(idempotency_keys.release(record.id))
+        raise
+
+    await idempotency_keys.complete(record.id, adapter.dump_json(response).decode())
+    return response
+
+
+# waits for the request holding the key, returning its record once it is done or
+# None if it failed and released the key
+async def _wait(existing: IdempotencyRecord) -> IdempotencyRecord | None:
+    deadline = asyncio.get_running_loop().time() + _LOCK_TIMEOUT
+    while existing.status == "pending":
+        if asyncio.get_running_loop().time() > deadline:
+            raise IdempotencyKeyInProgress()
+
+        await asyncio.sleep(_POLL_INTERVAL)
+        current = await idempotency_keys.get(existing.id)
+        if current is None:
+            return None
+        existing = current
+
+    return existing
@@ -0,0 +1,24 @@
+import weakref
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+# caches a value per object, for objects that can't be hashed such as pydantic
+# models; entries are dropped when their object is garbage collected, so values
+# must not reference it
+class IdentityCache(Generic[K, V]):
+    def __init__(self):
+        self._entries: dict[int, V] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K, build: Callable[[K], V]) -> V:
+        value = self._entries.get(id(key))
+        if value is None:
+            value = self._entries[id(key)] = build(key)
+            weakref.finalize(key, self._entries.pop, id(key), None)
+        return value
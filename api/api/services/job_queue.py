@@ -0,0 +1,178 @@
+import asyncio
+import contextlib
+import logging
+import os
+import random
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from pydantic import BaseModel
+
+from api.db import jobs as job_store
+
+JOB_QUEUE_ENABLED = os.environ.get("JOB_QUEUE", "0") == "1"
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "2"))
+JOB_FAILED_TTL = float(os.environ.get("JOB_FAILED_TTL", str(7 * 24 * 60 * 60)))
+
+JobHandler = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class JobQueueStats(BaseModel):
+    workers: int
+    running: int
+    enqueued: int
+    deduplicated: int
+    completed: int
+    retried: int
+    failed: int
+
+
+class JobQueue:
+    def __init__(
+        self,
+        concurrency: int,
+        max_attempts: int = 5,
+        lease: float = 600,
+        poll_interval: float = 5,
+        backoff: float = 2,
+        max_backoff: float = 300,
+        failed_ttl: float = JOB_FAILED_TTL,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failed_ttl = failed_ttl
+
+        self._handlers: dict[str, JobHandler] = {}
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        self._enqueued = 0
+        self._deduplicated = 0
+        self._completed = 0
+        self._retried = 0
+        self._failed = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    # jobs are deduplicated by name while queued or running, like Cloud Tasks
+    async def enqueue(self, name: str, kind: str, payload: dict[str, Any]) -> bool:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind}")
+
+        added = await job_store.insert(name, kind, payload)
+        if added:
+            self._enqueued += 1
+            self._wakeup.set()
+        else:
+            self._deduplicated += 1
+
+        return added
+
+    def start(self):
+        if self._workers:
+            return
+
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    # stops claiming new jobs and waits for running ones; whatever is still
+    # running after the timeout is handed back to the queue
+    async def drain(self, timeout: float = 30):
+        self._stopping = True
+        self._wakeup.set()
+
+        if running := list(self._running.values()):
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while not self._stopping:
+            self._wakeup.clear()
+
+            try:
+                job = await job_store.claim(list(self._handlers), self.lease)
+            except Exception as e:
+                logging.warning(f"Could not claim job: {e}")
+                job = None
+
+            if job is None:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: dict[str, Any]):
+        name = job["_id"]
+
+        async def run():
+            # finish before the lease runs out and another worker takes it over
+            async with asyncio.timeout(self.lease):
+                await self._handlers[job["kind"]](job["payload"])
+
+        task = asyncio.create_task(run())
+        self._running[name] = task
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not (self._stopping and task.cancelled()):
+                raise
+            await job_store.release(name)
+        except Exception as e:
+            await self._retry_or_fail(job, e)
+        else:
+            self._completed += 1
+            await job_store.complete(name)
+        finally:
+            del self._running[name]
+
+    async def _retry_or_fail(self, job: dict[str, Any], error: Exception):
+        name = job["_id"]
+        attempts = job["attempts"]
+
+        if attempts >= self.max_attempts:
+            logging.error(f"Job {name} failed after {attempts} attempts: {error}")
+            self._failed += 1
+            # kept around for inspection, then removed by the TTL index
+            await job_store.fail(
+                name, datetime.now(UTC) + timedelta(seconds=self.failed_ttl), str(error)
+            )
+            return
+
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1)
+        logging.warning(f"Job {name} failed, retrying in {delay:.1f}s: {error}")
+
+        self._retried += 1
+        await job_store.retry(
+            name, datetime.now(UTC) + timedelta(seconds=delay), str(error)
+        )
+
+    def stats(self) -> JobQueueStats:
+        return JobQueueStats(
+            workers=len(self._workers),
+            running=len(self._running),
+            enqueued=self._enqueued,
+            deduplicated=self._deduplicated,
+            completed=self._completed,
+            retried=self._retried,
+            failed=self._failed,
+        )
+
+
+queue = JobQueue(JOB_CONCURRENCY)
@@ -0,0 +1,116 @@
+import json
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonStringFieldExtractor:
+    # Pulls the value of a top-level string field out of a JSON object as it is
+    # being streamed, returning newly decoded text from each call to feed().
+    # Text before the opening brace (e.g. an LLM preamble) is ignored.
+
+    def __init__(self, field: str):
+        self.field = field
+        self.done = False
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token: list[str] = []
+        self._last_key: str | None = None
+        self._expect_key = False
+        self._capturing = False
+        self._unicode: str | None = None
+        self._high_surrogate: int | None = None
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+
+        for char in chunk:
+            if self.done:
+                break
+
+            if self._capturing:
+                self._feed_value_char(char, out)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._token.append(char)
+                elif char == "\\":
+                    self._escape = True
+                    self._token.append(char)
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._last_key = json.loads('"' + "".join(self._token) + '"')
+                        self._expect_key = False
+                else:
+                    self._token.append(char)
+                continue
+
+            match char:
+                case "{" | "[":
+                    self._depth += 1
+                    self._expect_key = char == "{" and self._depth == 1
+                case "}" | "]":
+                    self._depth -= 1
+                case '"':
+                    if (
+                        self._depth == 1
+                        and not self._expect_key
+                        and self._last_key == self.field
+                    ):
+                        self._capturing = True
+                        self._last_key = None
+                    else:
+                        self._in_string = True
+                        self._token = []
+                case ",":
+                    if self._depth == 1:
+                        self._expect_key = True
+                        self._last_key = None
+                case ":":
+                    pass
+                case _:
+                    if self._depth == 1 and not char.isspace():
+                        # a non-string value for the key we are watching
+                        self._last_key = None
+
+        return "".join(out)
+
+    def _feed_value_char(self, char: str, out: list[str]):
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                code = int(self._unicode, 16)
+                self._unicode = None
+                if 0xD800 <= code < 0xDC00:
+                    self._high_surrogate = code
+                elif 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                    high, self._high_surrogate = self._high_surrogate, None
+                    out.append(chr(0x10000 + ((high - 0xD800) << 10) + code - 0xDC00))
+                else:
+                    out.append(chr(code))
+        elif self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                out.append(_ESCAPES.get(char, char))
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._capturing = False
+            self.done = True
+        else:
+            out.append(char)
@@ -1,20 +1,59 @@
 import asyncio
-import json
+import contextlib
 import logging
 import os
 import re
-from enum import Enum
-from typing import TypeVar, overload
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextvars import ContextVar
+from enum import Enum, StrEnum
+from typing import Any, TypeVar, overload
 
 import numpy as np
-import websockets as ws
 from pydantic import BaseModel, TypeAdapter
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from api.db import llm_cache as llm_cache_store
+
+from .llm_breaker import CircuitBreaker, CircuitOpen
+from .llm_cache import ResponseCache, request_key
+from .llm_hedging import HedgeBudget, LatencyTracker
+from .llm_limiter import AdaptiveLimiter
+from .llm_pool import ConnectionPool, ConnectionRetired
+from .llm_singleflight import SingleFlight
 
 _LLM_URI: str = os.getenv("LLM_URI", "")
 
 assert _LLM_URI != "", "LLM_URI environment variable must be set"
 
+_POOL = ConnectionPool(
+    _LLM_URI,
+    max_size=int(os.getenv("LLM_POOL_SIZE", "16")),
+    max_streams=int(os.getenv("LLM_POOL_MAX_STREAMS", "8")),
+)
+
+_CACHE_BY_DEFAULT = os.getenv("LLM_CACHE_DEFAULT", "") == "1"
+
+_SINGLEFLIGHT = SingleFlight()
+
+_BREAKER_REROUTE = os.getenv("LLM_BREAKER_REROUTE", "") == "1"
+
+_HEDGE_BY_DEFAULT = os.getenv("LLM_HEDGE", "") == "1"
+_HEDGE_FALLBACK = os.getenv("LLM_HEDGE_FALLBACK", "") == "1"
+_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+_HEDGE_BUDGET = HedgeBudget(float(os.getenv("LLM_HEDGE_BUDGET", "0.1")))
+
+_CACHE = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+    store=llm_cache_store if os.getenv("LLM_CACHE_MONGO", "") == "1" else None,
+)
+
 
 class ModelVendor(str, Enum):
     OPENAI = "openai"
@@ -27,6 +66,13 @@ class ModelVendor(str, Enum):
             case ModelVendor.ANTHROPIC:
                 return 32
 
+    def max_concurrency_limit(self) -> int:
+        match self:
+            case ModelVendor.OPENAI:
+                return 12
+            case ModelVendor.ANTHROPIC:
+                return 128
+
 
 class Model(str, Enum):
     GPT_4 = "gpt4-new"
@@ -41,51 +87,171 @@ class Model(str, Enum):
             case Model.CLAUDE_3_SONNET | Model.CLAUDE_3_HAIKU:
                 return ModelVendor.ANTHROPIC
 
+    def fallback(self) -> "Model":
+        match self:
+            case Model.GPT_4:
+                return Model.CLAUDE_3_SONNET
+            case Model.CLAUDE_3_SONNET:
+                return Model.GPT_4
+            case Model.GPT_3_5:
+                return Model.CLAUDE_3_HAIKU
+            case Model.CLAUDE_3_HAIKU:
+                return Model.GPT_3_5
+
+
+class Priority(StrEnum):
+    INTERACTIVE = "interactive"
+    PREGENERATION = "pregeneration"
+    ONBOARDING = "onboarding"
+
+    def weight(self) -> float:
+        match self:
+            case Priority.INTERACTIVE:
+                return 6
+            case Priority.PREGENERATION:
+                return 2
+            case Priority.ONBOARDING:
+                return 1
+
+
+class PriorityScope:
+    def __init__(self, priority: Priority):
+        self.priority = priority
+
+    # calls of the scope still waiting for a slot move to the new priority's queue
+    def raise_to(self, priority: Priority):
+        if priority.weight() <= self.priority.weight():
+            return
+
+        self.priority = priority
+        for limiter in _GENERATE_LIMITERS.values():
+            limiter.reprioritize()
+
+
+_PRIORITY: ContextVar[PriorityScope | None] = ContextVar("llm_priority", default=None)
+
+
+@contextlib.contextmanager
+def priority_scope(priority: Priority) -> Iterator[PriorityScope]:
+    scope = PriorityScope(priority)
+    token = _PRIORITY.set(scope)
+    try:
+        yield scope
+    finally:
+        _PRIORITY.reset(token)
+
+
+def _slot_priority(priority: Priority | PriorityScope) -> str | Callable[[], str]:
+    if isinstance(priority, PriorityScope):
+        return lambda: priority.priority.value
+    return priority.value
+
+
+class Usage:
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+_USAGE: ContextVar[Usage | None] = ContextVar("llm_usage", default=None)
+
+
+# tallies the (estimated) tokens of every model call made within the scope,
+# including calls made by tasks spawned from it
+@contextlib.contextmanager
+def usage_scope() -> Iterator[Usage]:
+    usage = Usage()
+    token = _USAGE.set(usage)
+    try:
+        yield usage
+    finally:
+        _USAGE.reset(token)
+
+
+def _estimate_tokens(text: str) -> int:
+    # the gateway does not report usage; ~4 characters per token for English
+    return len(text) // 4 + 1
 
-_GENERATE_SEMAPHORES = {
-    vendor: asyncio.Semaphore(vendor.concurrency_limit()) for vendor in ModelVendor
+
+# measured from when a call gets its limiter slot, so time spent queued under
+# congestion does not count as the model being slow
+_LATENCIES = {model: LatencyTracker() for model in Model}
+
+# set once a call made within the context gets its limiter slot
+_SENT: ContextVar[asyncio.Event | None] = ContextVar("llm_sent", default=None)
+
+_BREAKERS = {model: CircuitBreaker(model.name) for model in Model}
+_EMBED_BREAKER = CircuitBreaker("EMBEDDING")
+
+# the concurrency limits are per vendor, shared by all of its models
+_GENERATE_LIMITERS = {
+    vendor: AdaptiveLimiter(
+        initial=vendor.concurrency_limit(),
+        maximum=vendor.max_concurrency_limit(),
+        weights={priority.value: priority.weight() for priority in Priority},
+    )
+    for vendor in ModelVendor
 }
 
 
 async def _generate_unchecked(
-    model: Model, prompt: str, system: str, temperature: float | None = None
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    priority: Priority | PriorityScope = Priority.INTERACTIVE,
 ):
-    async with _GENERATE_SEMAPHORES[model.vendor()], asyncio.timeout(120), ws.connect(
-        _LLM_URI
-    ) as conn:
-        action = {
-            "action": "runModel",
-            "model": model.value,
-            "system": system,
-            "prompt": prompt,
-            "temperature": temperature,
-        }
-        await conn.send(json.dumps(action))
-
-        response, response_dict = None, None
-        while response_dict is None or "message" in response_dict:
-            response = await conn.recv()
-
-            response_dict = json.loads(response)
-
-            if (
-                "message" in response_dict
-                and response_dict["message"] == "Internal server error"
-            ):
-                logging.error(
-                    f"Could not invoke LLM generate: ISE. action: {action}. "
-                    f"response: {response}"
-                )
-                raise RuntimeError("Could not invoke LLM generate: ISE")
-
-        print("-----------------")
-        print(system)
-        print(prompt)
-        print("---")
-        print(response_dict)
-        print("-----------------")
-
-        return response_dict["result"]
+    action = {
+        "action": "runModel",
+        "model": model.value,
+        "system": system,
+        "prompt": prompt,
+        "temperature": temperature,
+    }
+
+    usage = _USAGE.get()
+    if usage is not None:
+        usage.prompt_tokens += _estimate_tokens(system) + _estimate_tokens(prompt)
+
+    with _BREAKERS[model].call(ignore=(ConnectionRetired,)):
+        async with _GENERATE_LIMITERS[model.vendor()].slot(_slot_priority(priority)):
+            started = time.monotonic()
+            if sent := _SENT.get():
+                sent.set()
+
+            async with asyncio.timeout(120), _POOL.session(action) as conn:
+                response_dict = None
+                while response_dict is None or "message" in response_dict:
+                    response_dict = await conn.recv()
+
+                    if (
+                        "message" in response_dict
+                        and response_dict["message"] == "Internal server error"
+                    ):
+                        logging.error(
+                            f"Could not invoke LLM generate: ISE. action: {action}. "
+                            f"response: {response_dict}"
+                        )
+                        raise RuntimeError("Could not invoke LLM generate: ISE")
+
+                print("-----------------")
+                print(system)
+                print(prompt)
+                print("---")
+                print(response_dict)
+                print("-----------------")
+
+                _LATENCIES[model].record(time.monotonic() - started)
+                if usage is not None:
+                    usage.completion_tokens += _estimate_tokens(
+                        str(response_dict["result"])
+                    )
+
+                return response_dict["result"]
 
 
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
@@ -98,6 +264,9 @@ async def generate(
     prompt: str,
     system: str,
     temperature: float | None = None,
+    cache: bool | None = None,
+    priority: Priority | None = None,
+    hedge: bool | None = None,
 ) -> str: ...
 
 
@@ -108,66 +277,435 @@ async def generate(
     prompt: str,
     system: str,
     temperature: float | None = None,
+    cache: bool | None = None,
+    priority: Priority | None = None,
+    hedge: bool | None = None,
 ) -> SchemaType: ...
 
 
-@retry(wait=wait_random_exponential(), stop=stop_after_attempt(3))
 async def generate(
     schema: type[SchemaType] | TypeAdapter[SchemaType] | None,
     model: Model,
     prompt: str,
     system: str,
     temperature: float | None = None,
+    cache: bool | None = None,
+    priority: Priority | None = None,
+    hedge: bool | None = None,
+) -> SchemaType | str:
+    call_priority = priority or _PRIORITY.get() or Priority.INTERACTIVE
+    use_cache = _CACHE_BY_DEFAULT if cache is None else cache
+    use_hedge = _HEDGE_BY_DEFAULT if hedge is None else hedge
+
+    # sampled calls are expected to give independent completions, so they are
+    # not shared and need no key unless cached
+    share = not temperature
+
+    # the schema is hashed into the key, which is only worth it when used
+    key = None
+    if use_cache or share:
+        key = request_key(
+            action="runModel",
+            model=model.value,
+            system=system,
+            prompt=prompt,
+            temperature=temperature,
+            schema=_schema_identity(schema),
+        )
+
+    if use_cache:
+        cached = await _CACHE.get(key, lambda stored: _load_cached(schema, stored))
+        if cached is not None:
+            return _copy_result(cached)
+
+    async def run():
+        generate_fn = _generate_hedged if use_hedge else _generate_validated
+        try:
+            result = await generate_fn(
+                schema, _route(model), prompt, system, temperature, call_priority
+            )
+        except CircuitOpen:
+            fallback = model.fallback()
+            if not _BREAKER_REROUTE or _BREAKERS[fallback].is_open():
+                raise
+            logging.warning(f"Rerouting {model.name} to {fallback.name}")
+            result = await generate_fn(
+                schema, fallback, prompt, system, temperature, call_priority
+            )
+        if use_cache:
+            await _CACHE.set(key, result, lambda value: _dump_cached(schema, value))
+        return result
+
+    if share:
+        result, shared = await _SINGLEFLIGHT.do(key, run)
+    else:
+        result, shared = await run(), False
+
+    # the same object may be held by the cache or other callers
+    return _copy_result(result) if shared or use_cache else result
+
+
+def _route(model: Model) -> Model:
+    if _BREAKER_REROUTE and _BREAKERS[model].is_open():
+        fallback = model.fallback()
+        if not _BREAKERS[fallback].is_open():
+            return fallback
+    return model
+
+
+def _copy_result(result: SchemaType | str) -> SchemaType | str:
+    return result.model_copy(deep=True) if isinstance(result, BaseModel) else result
+
+
+@retry(
+    retry=retry_if_not_exception_type(CircuitOpen),
+    wait=wait_random_exponential(),
+    stop=stop_after_attempt(3),
+)
+async def _generate_validated(
+    schema: type[SchemaType] | TypeAdapter[SchemaType] | None,
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    priority: Priority | PriorityScope = Priority.INTERACTIVE,
 ) -> SchemaType | str:
     response = None
     try:
-        response = await _generate_unchecked(model, prompt, system, temperature)
-        data = (
-            response[response.index("{") : response.rindex("}") + 1]
-            if schema
-            else response
+        response = await _generate_unchecked(
+            model, prompt, system, temperature, priority
         )
+        return parse(schema, response)
 
-        # strip control characters from data
-        data = re.sub(r"[\x00-\x1f\x7f]", "", data)
-
-        if schema is None:
-            return data
-        if isinstance(schema, TypeAdapter):
-            return schema.validate_json(data)
-        else:
-            return schema.model_validate_json(data)
-
+    except CircuitOpen:
+        raise
     except Exception as e:
         logging.warning(f"Generate Unexpected error: {e}. {response}")
 
         raise RuntimeError("Could not generate valid response") from e
 
 
+async def _generate_hedged(
+    schema: type[SchemaType] | TypeAdapter[SchemaType] | None,
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    priority: Priority | PriorityScope = Priority.INTERACTIVE,
+) -> SchemaType | str:
+    _HEDGE_BUDGET.record_request()
+
+    sent = asyncio.Event()
+
+    async def run_primary():
+        _SENT.set(sent)
+        return await _generate_validated(
+            schema, model, prompt, system, temperature, priority
+        )
+
+    primary = asyncio.create_task(run_primary())
+    pending = {primary}
+    delay = _LATENCIES[model].percentile(_HEDGE_PERCENTILE)
+
+    try:
+        if delay is not None:
+            # the delay runs from when the primary call is sent: a call still
+            # queued for a limiter slot is not slow, the vendor is congested
+            sending = asyncio.create_task(sent.wait())
+            try:
+                await asyncio.wait(
+                    {primary, sending}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                sending.cancel()
+
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and _HEDGE_BUDGET.try_spend():
+                hedge_model = model.fallback() if _HEDGE_FALLBACK else model
+                logging.info(f"Hedging {model.name} after {delay:.1f}s")
+                pending.add(
+                    asyncio.create_task(
+                        _generate_validated(
+                            schema, hedge_model, prompt, system, temperature, priority
+                        )
+                    )
+                )
+            pending |= done
+
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        _HEDGE_BUDGET.record_win()
+                    return task.result()
+                error = task.exception()
+
+        assert error is not None
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@overload
+def parse(schema: None, response: str) -> str: ...
+
+
+@overload
+def parse(
+    schema: type[SchemaType] | TypeAdapter[SchemaType], response: str
+) -> SchemaType: ...
+
+
+def parse(
+    schema: type[SchemaType] | TypeAdapter[SchemaType] | None, response: str
+) -> SchemaType | str:
+    data = (
+        response[response.index("{") : response.rindex("}") + 1] if schema else response
+    )
+
+    # strip control characters from data
+    data = re.sub(r"[\x00-\x1f\x7f]", "", data)
+
+    if schema is None:
+        return data
+    if isinstance(schema, TypeAdapter):
+        return schema.validate_json(data)
+    else:
+        return schema.model_validate_json(data)
+
+
+async def generate_stream(
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    priority: Priority | None = None,
+) -> AsyncIterator[str]:
+    action = {
+        "action": "runModel",
+        "model": model.value,
+        "system": system,
+        "prompt": prompt,
+        "temperature": temperature,
+        "stream": True,
+    }
+    call_priority = priority or _PRIORITY.get() or Priority.INTERACTIVE
+
+    with _BREAKERS[model].call(ignore=(ConnectionRetired,)):
+        async with (
+            _GENERATE_LIMITERS[model.vendor()].slot(_slot_priority(call_priority)),
+            asyncio.timeout(120),
+            _POOL.session(action) as conn,
+        ):
+            streamed = False
+            while True:
+                response_dict = await conn.recv()
+
+                if response_dict.get("message") == "Internal server error":
+                    raise RuntimeError("Could not invoke LLM generate: ISE")
+
+                if "delta" in response_dict:
+                    streamed = True
+                    yield response_dict["delta"]
+                elif "result" in response_dict:
+                    # gateways that do not stream send the whole completion at once
+                    if not streamed:
+                        yield response_dict["result"]
+                    return
+
+
+def _schema_identity(schema: type[BaseModel] | TypeAdapter | None) -> Any:
+    if schema is None:
+        return None
+    if isinstance(schema, TypeAdapter):
+        return schema.json_schema()
+    return schema.model_json_schema()
+
+
+def _load_cached(schema: type[SchemaType] | TypeAdapter[SchemaType] | None, stored):
+    if schema is None:
+        return stored
+    if isinstance(schema, TypeAdapter):
+        return schema.validate_python(stored)
+    return schema.model_validate(stored)
+
+
+def _dump_cached(schema: type[SchemaType] | TypeAdapter[SchemaType] | None, value):
+    if schema is None:
+        return value
+    if isinstance(schema, TypeAdapter):
+        return schema.dump_python(value, mode="json")
+    return value.model_dump(mode="json")
+
+
 _EMBED_SEMAPHORE = asyncio.Semaphore(32)
 
 
-@retry(wait=wait_random_exponential(), stop=stop_after_attempt(3))
 async def embed(text: str) -> np.ndarray:
-    async with _EMBED_SEMAPHORE, ws.connect(_LLM_URI) as conn:
-        action = {"action": "extractEmbedding", "prompt": text}
-        await conn.send(json.dumps(action))
-
-        response, response_dict = None, None
-        while response_dict is None or "message" in response_dict:
-            response = await conn.recv()
-            response_dict = json.loads(response)
-
-            if (
-                "message" in response_dict
-                and response_dict["message"] == "Internal server error"
+    key = request_key(action="extractEmbedding", prompt=text)
+    result, _ = await _SINGLEFLIGHT.do(key, lambda: _embed(text))
+
+    return result
+
+
+@retry(
+    retry=retry_if_not_exception_type(CircuitOpen),
+    wait=wait_random_exponential(),
+    stop=stop_after_attempt(3),
+)
+async def _embed(text: str) -> np.ndarray:
+    action = {"action": "extractEmbedding", "prompt": text}
+
+    with _EMBED_BREAKER.call(ignore=(ConnectionRetired,)):
+        async with _EMBED_SEMAPHORE, _POOL.session(action) as conn:
+            response_dict = None
+            while response_dict is None or "message" in response_dict:
+                response_dict = await conn.recv()
+
+                if (
+                    "message" in response_dict
+                    and response_dict["message"] == "Internal server error"
+                ):
+                    raise RuntimeError("Could not invoke LLM embed: ISE")
+
+            result = response_dict["result"]
+
+            return np.array(result, dtype=np.float32)
+
+
+class _BatchEmbeddingUnsupported(Exception):
+    pass
+
+
+class _EmbedBatchSizer:
+    def __init__(self, initial: int, minimum: int, maximum: int, target: float):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+
+    def observe(self, count: int, elapsed: float):
+        # aim for chunks that take about `target` seconds, smoothing toward it
+        per_text = max(elapsed / count, 1e-6)
+        proposed = int(self.target / per_text)
+        self.size = max(self.minimum, min(self.maximum, (self.size + proposed) // 2))
+
+    def backoff(self):
+        self.size = max(self.minimum, self.size // 2)
+
+
+_EMBED_BATCH_ENABLED = os.getenv("LLM_EMBED_BATCH", "1") == "1"
+
+_EMBED_BATCH_SIZER = _EmbedBatchSizer(
+    initial=32,
+    minimum=4,
+    maximum=int(os.getenv("LLM_EMBED_BATCH_MAX", "256")),
+    target=2.0,
+)
+
+
+@retry(
+    retry=retry_if_not_exception_type((_BatchEmbeddingUnsupported, CircuitOpen)),
+    wait=wait_random_exponential(),
+    stop=stop_after_attempt(3),
+)
+async def _embed_batch(texts: list[str]) -> np.ndarray:
+    action = {"action": "extractEmbeddings", "prompts": texts}
+
+    start = time.monotonic()
+    try:
+        with _EMBED_BREAKER.call(
+            ignore=(_BatchEmbeddingUnsupported, ConnectionRetired)
+        ):
+            async with (
+                _EMBED_SEMAPHORE,
+                asyncio.timeout(120),
+                _POOL.session(action) as conn,
             ):
-                raise RuntimeError("Could not invoke LLM embed: ISE")
+                response_dict = None
+                while response_dict is None or "message" in response_dict:
+                    response_dict = await conn.recv()
+
+                    match response_dict.get("message"):
+                        case "Internal server error":
+                            raise RuntimeError("Could not invoke LLM embed: ISE")
+                        case "Forbidden":
+                            raise _BatchEmbeddingUnsupported()
+
+                result = np.array(response_dict["result"], dtype=np.float32)
+    except (_BatchEmbeddingUnsupported, CircuitOpen):
+        raise
+    except Exception:
+        _EMBED_BATCH_SIZER.backoff()
+        raise
+
+    if result.ndim != 2 or len(result) != len(texts):
+        raise _BatchEmbeddingUnsupported()
+
+    _EMBED_BATCH_SIZER.observe(len(texts), time.monotonic() - start)
+
+    return result
+
+
+async def embed_many(texts: list[str]) -> np.ndarray:
+    global _EMBED_BATCH_ENABLED
+
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    # embed each distinct text once and scatter the rows back
+    unique_index = {text: i for i, text in enumerate(dict.fromkeys(texts))}
+    unique = list(unique_index)
+    rows = np.fromiter((unique_index[text] for text in texts), dtype=np.intp)
+
+    if _EMBED_BATCH_ENABLED:
+        size = _EMBED_BATCH_SIZER.size
+        chunks = [unique[i : i + size] for i in range(0, len(unique), size)]
+
+        try:
+            matrices = await asyncio.gather(*[_embed_batch(c) for c in chunks])
+            return np.concatenate(matrices, dtype=np.float32)[rows]
+        except _BatchEmbeddingUnsupported:
+            logging.warning("LLM service does not support batch embeddings")
+            _EMBED_BATCH_ENABLED = False
+
+    embeddings = await asyncio.gather(*[embed(text) for text in unique])
+
+    return np.stack(embeddings)[rows]
+
+
+def pool_stats():
+    return _POOL.stats()
+
+
+def cache_stats():
+    return _CACHE.stats()
+
+
+def singleflight_stats():
+    return _SINGLEFLIGHT.stats()
+
+
+def hedge_stats():
+    return _HEDGE_BUDGET.stats()
+
+
+def breaker_stats():
+    stats = {model.name: breaker.stats() for model, breaker in _BREAKERS.items()}
+    stats[_EMBED_BREAKER.name] = _EMBED_BREAKER.stats()
+    return stats
 
-        result = response_dict["result"]
 
-        return np.array(result)
+def limiter_stats():
+    return {
+        vendor.value: limiter.stats() for vendor, limiter in _GENERATE_LIMITERS.items()
+    }
 
 
-async def embed_many(texts: list[str]) -> list[np.ndarray]:
-    return await asyncio.gather(*[embed(text) for text in texts])
+async def close():
+    await _POOL.close()
@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from enum import StrEnum
+
+from pydantic import BaseModel
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CircuitTransition(BaseModel):
+    at: datetime
+    previous: CircuitState
+    state: CircuitState
+
+
+class CircuitStats(BaseModel):
+    state: CircuitState
+    consecutive_failures: int
+    rejected: int
+    transitions: list[CircuitTransition]
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        self._transitions: deque[CircuitTransition] = deque(maxlen=50)
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def is_open(self) -> bool:
+        return (
+            self._state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at < self.reset_timeout
+        )
+
+    def _transition(self, state: CircuitState):
+        if state == self._state:
+            return
+
+        logging.warning(
+            f"LLM circuit {self.name}: {self._state.value} -> {state.value}"
+        )
+        self._transitions.append(
+            CircuitTransition(at=datetime.now(UTC), previous=self._state, state=state)
+        )
+        self._state = state
+        if state == CircuitState.OPEN:
+            self._opened_at = time.monotonic()
+
+    def _allow(self) -> bool:
+        if self._state == CircuitState.OPEN and not self.is_open():
+            self._transition(CircuitState.HALF_OPEN)
+            self._probes = 0
+
+        match self._state:
+            case CircuitState.CLOSED:
+                return True
+            case CircuitState.OPEN:
+                return False
+            case CircuitState.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+                return True
+
+    def _on_success(self):
+        self._consecutive_failures = 0
+        self._transition(CircuitState.CLOSED)
+
+    def _on_failure(self):
+        self._consecutive_failures += 1
+        if (
+            self._state == CircuitState.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            self._transition(CircuitState.OPEN)
+
+    def _on_abandoned(self):
+        if self._state == CircuitState.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    @contextlib.contextmanager
+    def call(self, ignore: tuple[type[Exception], ...] = ()) -> Iterator[None]:
+        if not self._allow():
+            self._rejected += 1
+            raise CircuitOpen(f"LLM circuit for {self.name} is open")
+
+        try:
+            yield
+        # GeneratorExit is raised into a generator whose consumer stopped early
+        except (asyncio.CancelledError, GeneratorExit, *ignore):
+            self._on_abandoned()
+            raise
+        except Exception:
+            self._on_failure()
+            raise
+        else:
+            self._on_success()
+
+    def stats(self) -> CircuitStats:
+        return CircuitStats(
+            state=self._state,
+            consecutive_failures=self._consecutive_failures,
+            rejected=self._rejected,
+            transitions=list(self._transitions),
+        )
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any, Protocol, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class CacheStore(Protocol):
+    async def get(self, key: str) -> Any | None: ...
+
+    async def set(self, key: str, value: Any, expires_at: datetime) -> None: ...
+
+
+class CacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    hits: int
+    store_hits: int
+    misses: int
+
+
+def request_key(**request: Any) -> str:
+    encoded = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl: float, store: CacheStore | None = None):
+        assert max_entries > 0, "max_entries must be positive"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._hits = 0
+        self._store_hits = 0
+        self._misses = 0
+
+    def _get_local(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str, load: Callable[[Any], T]) -> T | None:
+        value = self._get_local(key)
+        if value is not None:
+            self._hits += 1
+            return value
+
+        if self.store is not None:
+            stored = await self.store.get(key)
+            if stored is not None:
+                value = load(stored)
+                self._set_local(key, value, self.ttl)
+                self._store_hits += 1
+                return value
+
+        self._misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, dump: Callable[[Any], Any]):
+        self._set_local(key, value, self.ttl)
+
+        if self.store is not None:
+            expires_at = datetime.now(UTC) + timedelta(seconds=self.ttl)
+            await self.store.set(key, dump(value), expires_at)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            entries=len(self._entries),
+            max_entries=self.max_entries,
+            hits=self._hits,
+            store_hits=self._store_hits,
+            misses=self._misses,
+        )
@@ -0,0 +1,61 @@
+import math
+from collections import deque
+
+from pydantic import BaseModel
+
+
+class HedgeStats(BaseModel):
+    requests: int
+    hedged: int
+    hedge_wins: int
+    budget_denied: int
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1)
+        return ordered[max(index, 0)]
+
+
+class HedgeBudget:
+    def __init__(self, fraction: float):
+        # one hedge per request at most, so load can never more than double
+        self.fraction = min(max(fraction, 0.0), 1.0)
+
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._budget_denied = 0
+
+    def record_request(self):
+        self._requests += 1
+
+    def try_spend(self) -> bool:
+        if self._hedged + 1 > self.fraction * self._requests:
+            self._budget_denied += 1
+            return False
+
+        self._hedged += 1
+        return True
+
+    def record_win(self):
+        self._hedge_wins += 1
+
+    def stats(self) -> HedgeStats:
+        return HedgeStats(
+            requests=self._requests,
+            hedged=self._hedged,
+            hedge_wins=self._hedge_wins,
+            budget_denied=self._budget_denied,
+        )
@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Mapping
+
+from pydantic import BaseModel
+
+
+class QueueStats(BaseModel):
+    queue_depth: int
+    granted: int
+    wait_total: float
+    wait_max: float
+    wait_avg: float | None
+
+
+class LimiterStats(BaseModel):
+    limit: float
+    in_flight: int
+    queue_depth: int
+    successes: int
+    errors: int
+    decreases: int
+    latency_short: float | None
+    latency_long: float | None
+    queues: dict[str, QueueStats]
+
+
+# a class name, or a function returning the current class of a waiter whose
+# priority may change while it waits
+PriorityClass = str | Callable[[], str]
+
+_Waiter = tuple[asyncio.Future[None], float, PriorityClass]
+
+
+class _ClassQueue:
+    def __init__(self, weight: float):
+        assert weight > 0, "weight must be positive"
+        self.weight = weight
+        self.waiters: deque[_Waiter] = deque()
+        self.virtual_time = 0.0
+
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def stats(self) -> QueueStats:
+        return QueueStats(
+            queue_depth=len(self.waiters),
+            granted=self.granted,
+            wait_total=self.wait_total,
+            wait_max=self.wait_max,
+            wait_avg=self.wait_total / self.granted if self.granted else None,
+        )
+
+
+# AIMD: the limit grows by about one slot per window of successful calls and is cut
+# multiplicatively on errors or when recent latency inflates past the long-term mean.
+# Waiters are queued per class and slots are granted by weighted fair queuing.
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int | None = None,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown: float = 1.0,
+        weights: Mapping[str, float] | None = None,
+    ):
+        assert 0 < minimum <= initial, "initial limit must be at least minimum"
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial * 4
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+
+        self._queues = {
+            name: _ClassQueue(weight)
+            for name, weight in (weights or {"default": 1.0}).items()
+        }
+        self._virtual_time = 0.0
+
+        self._latency_short: float | None = None
+        self._latency_long: float | None = None
+
+        self._successes = 0
+        self._errors = 0
+        self._decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _waiting(self) -> int:
+        return sum(len(queue.waiters) for queue in self._queues.values())
+
+    def _grant(self, queue: _ClassQueue, waited: float):
+        self._in_flight += 1
+        queue.granted += 1
+        queue.wait_total += waited
+        queue.wait_max = max(queue.wait_max, waited)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._in_flight < self.limit:
+            backlogged = [q for q in self._queues.values() if q.waiters]
+            if not backlogged:
+                return
+
+            queue = min(backlogged, key=lambda q: q.virtual_time)
+            future, enqueued, _ = queue.waiters.popleft()
+
+            self._virtual_time = queue.virtual_time
+            queue.virtual_time += 1 / queue.weight
+            self._grant(queue, now - enqueued)
+            future.set_result(None)
+
+    def _queue(self, priority: PriorityClass) -> _ClassQueue:
+        return self._queues[priority() if callable(priority) else priority]
+
+    def _enqueue(self, queue: _ClassQueue, waiter: _Waiter):
+        if not queue.waiters:
+            # a class returning from idle must not claim credit for its idle time
+            queue.virtual_time = max(queue.virtual_time, self._virtual_time)
+        queue.waiters.append(waiter)
+
+    async def acquire(self, priority: PriorityClass = "default"):
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, time.monotonic(), priority)
+        self._enqueue(self._queue(priority), waiter)
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before cancellation, hand it on
+                self._in_flight -= 1
+            else:
+                for queue in self._queues.values():
+                    if waiter in queue.waiters:
+                        queue.waiters.remove(waiter)
+                        break
+            self._dispatch()
+            raise
+
+    # moves waiters whose priority has changed to the queue of their new class
+    def reprioritize(self):
+        for queue in self._queues.values():
+            for waiter in list(queue.waiters):
+                target = self._queue(waiter[2])
+                if target is not queue:
+                    queue.waiters.remove(waiter)
+                    self._enqueue(target, waiter)
+
+    def release(self, latency: float | None, error: bool):
+        self._in_flight -= 1
+
+        if error:
+            self._errors += 1
+            self._decrease()
+        elif latency is not None:
+            self._successes += 1
+            self._observe_latency(latency)
+            if self._latency_inflated():
+                self._decrease()
+            elif self._in_flight + 1 >= self.limit:
+                # only grow while the current limit is actually being used
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+
+        self._dispatch()
+
+    def _observe_latency(self, latency: float):
+        if self._latency_short is None or self._latency_long is None:
+            self._latency_short = self._latency_long = latency
+            return
+
+        self._latency_short = 0.3 * latency + 0.7 * self._latency_short
+        self._latency_long = 0.02 * latency + 0.98 * self._latency_long
+
+    def _latency_inflated(self) -> bool:
+        return (
+            self._latency_short is not None
+            and self._latency_long is not None
+            and self._latency_short > self.latency_tolerance * self._latency_long
+        )
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+
+        self._last_decrease = now
+        self._decreases += 1
+        self._limit = max(self.minimum, self._limit * self.backoff)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: PriorityClass = "default") -> AsyncIterator[None]:
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.release(None, error=False)
+            raise
+        except BaseException:
+            self.release(time.monotonic() - started, error=True)
+            raise
+        else:
+            self.release(time.monotonic() - started, error=False)
+
+    def stats(self) -> LimiterStats:
+        return LimiterStats(
+            limit=self._limit,
+            in_flight=self._in_flight,
+            queue_depth=self._waiting(),
+            successes=self._successes,
+            errors=self._errors,
+            decreases=self._decreases,
+            latency_short=self._latency_short,
+            latency_long=self._latency_long,
+            queues={name: queue.stats() for name, queue in self._queues.items()},
+        )
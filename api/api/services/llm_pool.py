@@ -0,0 +1,269 @@
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+from collections.abc import AsyncIterator
+from typing import Any
+
+import websockets as ws
+from pydantic import BaseModel
+
+_CLOSED = object()
+_RETIRED = object()
+
+
+class ConnectionClosed(RuntimeError):
+    pass
+
+
+# the socket was dropped over an error that could not be attributed to one of
+# its requests, so the request did not fail on its own account
+class ConnectionRetired(ConnectionClosed):
+    pass
+
+
+class PoolStats(BaseModel):
+    size: int
+    max_size: int
+    multiplexed: int
+    in_flight: int
+    capacity: int
+    utilization: float
+    opened_total: int
+    closed_total: int
+    requests_total: int
+
+
+class _PooledConnection:
+    def __init__(self, conn: ws.WebSocketClientProtocol):
+        self.conn = conn
+        self.pending: dict[str, asyncio.Queue[Any]] = {}
+        # the gateway is only trusted to multiplex once it has echoed a request id
+        self.multiplexed = False
+        self.retired = False
+        self.last_used = asyncio.get_running_loop().time()
+        self.reader = asyncio.create_task(self._read())
+
+    @property
+    def open(self) -> bool:
+        return self.conn.open and not self.reader.done() and not self.retired
+
+    def capacity(self, max_streams: int) -> int:
+        return max_streams if self.multiplexed else 1
+
+    async def _read(self):
+        end = _CLOSED
+        try:
+            async for raw in self.conn:
+                frame = json.loads(raw)
+                request_id = frame.get("requestId")
+
+                if request_id is not None:
+                    if request_id in self.pending:
+                        self.multiplexed = True
+                        self.pending[request_id].put_nowait(frame)
+                    else:
+                        # a late reply to a request that timed out or was cancelled
+                        logging.info(f"Dropping LLM frame for {request_id}")
+                elif not self.multiplexed and len(self.pending) == 1:
+                    # without request ids the socket carries one request at a time
+                    next(iter(self.pending.values())).put_nowait(frame)
+                elif frame.get("message") == "Internal server error":
+                    # gateway errors are not tagged, so the stream they belong to
+                    # is unknown; retire the socket instead of failing them all
+                    logging.warning("Retiring LLM connection after untagged ISE")
+                    self.retired = True
+                    end = _RETIRED
+                    break
+                else:
+                    logging.warning(f"Dropping unroutable LLM frame: {raw!r}")
+        except ws.ConnectionClosed:
+            pass
+        except Exception as e:
+            logging.warning(f"LLM connection reader failed: {e}")
+        finally:
+            for queue in self.pending.values():
+                queue.put_nowait(end)
+
+        if end is _RETIRED:
+            await self.conn.close()
+
+    async def close(self):
+        await self.conn.close()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.reader
+
+
+class Stream:
+    def __init__(self, queue: asyncio.Queue[Any]):
+        self._queue = queue
+
+    async def recv(self) -> dict:
+        frame = await self._queue.get()
+        if frame is _CLOSED:
+            raise ConnectionClosed("LLM connection closed")
+        if frame is _RETIRED:
+            raise ConnectionRetired("LLM connection retired")
+        return frame
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        uri: str,
+        max_size: int,
+        max_streams: int,
+        idle_timeout: float = 300,
+        health_check_interval: float = 30,
+    ):
+        assert max_size > 0 and max_streams > 0
+        self.uri = uri
+        self.max_size = max_size
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._connections: list[_PooledConnection] = []
+        self._connecting = 0
+        self._available = asyncio.Condition()
+        self._health_check: asyncio.Task | None = None
+        self._closing: set[asyncio.Task] = set()
+
+        self._opened_total = 0
+        self._closed_total = 0
+        self._requests_total = 0
+
+    def _find_available(self) -> _PooledConnection | None:
+        self._connections = [c for c in self._connections if c.open]
+        candidates = [
+            c
+            for c in self._connections
+            if len(c.pending) < c.capacity(self.max_streams)
+        ]
+        # prefer the busiest socket that still has room so idle ones can be reaped
+        return max(candidates, key=lambda c: len(c.pending), default=None)
+
+    async def _acquire(self) -> _PooledConnection:
+        if self._health_check is None or self._health_check.done():
+            self._health_check = asyncio.create_task(self._check_health())
+
+        async with self._available:
+            while True:
+                connection = self._find_available()
+                if connection is not None:
+                    return connection
+                if len(self._connections) + self._connecting < self.max_size:
+                    self._connecting += 1
+                    break
+                await self._available.wait()
+
+        connection = None
+        try:
+            connection = _PooledConnection(await ws.connect(self.uri))
+            self._opened_total += 1
+        finally:
+            async with self._available:
+                self._connecting -= 1
+                if connection is not None:
+                    self._connections.append(connection)
+                self._available.notify_all()
+
+        return connection
+
+    async def _release(self, connection: _PooledConnection, request_id: str):
+        connection.pending.pop(request_id, None)
+        connection.last_used = asyncio.get_running_loop().time()
+        async with self._available:
+            self._available.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def session(self, action: dict) -> AsyncIterator[Stream]:
+        request_id = uuid.uuid4().hex
+        action = {**action, "requestId": request_id}
+        self._requests_total += 1
+
+        for attempt in range(2):
+            connection = await self._acquire()
+            queue: asyncio.Queue[Any] = asyncio.Queue()
+            connection.pending[request_id] = queue
+            try:
+                await connection.conn.send(json.dumps(action))
+                break
+            except ws.ConnectionClosed:
+                await self._release(connection, request_id)
+                # stale socket, reconnect transparently once
+                if attempt == 1:
+                    raise
+
+        try:
+            yield Stream(queue)
+        except BaseException:
+            # a gateway that does not echo request ids would send the unanswered
+            # reply to the socket's next request
+            if not connection.multiplexed:
+                self._retire(connection)
+            raise
+        finally:
+            await self._release(connection, request_id)
+
+    def _retire(self, connection: _PooledConnection):
+        connection.retired = True
+        if connection in self._connections:
+            self._connections.remove(connection)
+            self._closed_total += 1
+        task = asyncio.create_task(connection.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close_connection(self, connection: _PooledConnection):
+        if connection in self._connections:
+            self._connections.remove(connection)
+        self._closed_total += 1
+        await connection.close()
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+
+            now = asyncio.get_running_loop().time()
+            for connection in list(self._connections):
+                if connection.pending:
+                    continue
+                if (
+                    not connection.open
+                    or now - connection.last_used > self.idle_timeout
+                ):
+                    await self._close_connection(connection)
+                    continue
+                try:
+                    async with asyncio.timeout(10):
+                        await (await connection.conn.ping())
+                except Exception:
+                    logging.info("Dropping unhealthy LLM connection")
+                    await self._close_connection(connection)
+
+    async def close(self):
+        if self._health_check is not None:
+            self._health_check.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_check
+        await asyncio.gather(
+            *[self._close_connection(c) for c in list(self._connections)],
+            *self._closing,
+        )
+
+    def stats(self) -> PoolStats:
+        in_flight = sum(len(c.pending) for c in self._connections)
+        capacity = sum(c.capacity(self.max_streams) for c in self._connections)
+        return PoolStats(
+            size=len(self._connections),
+            max_size=self.max_size,
+            multiplexed=sum(c.multiplexed for c in self._connections),
+            in_flight=in_flight,
+            capacity=capacity,
+            utilization=in_flight / capacity if capacity else 0.0,
+            opened_total=self._opened_total,
+            closed_total=self._closed_total,
+            requests_total=self._requests_total,
+        )
@@ -0,0 +1,63 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class SingleFlightStats(BaseModel):
+    in_flight: int
+    leaders: int
+    coalesced: int
+
+
+class _Call(Generic[T]):
+    def __init__(self, task: asyncio.Task[T]):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, _Call[Any]] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    # runs fn once for all concurrent callers with the same key, returning the
+    # result and whether it was shared with an earlier caller
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        call = self._calls.get(key)
+        shared = call is not None
+
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            self._leaders += 1
+
+            def forget(_, call=call):
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+            call.task.add_done_callback(forget)
+        else:
+            self._coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shielded so one caller going away does not fail the others
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            in_flight=len(self._calls),
+            leaders=self._leaders,
+            coalesced=self._coalesced,
+        )
@@ -1,3 +1,5 @@
+import logging
+from collections.abc import Awaitable, Callable
 from typing import Annotated
 
 from pydantic import AfterValidator, BaseModel
@@ -11,6 +13,12 @@ from api.schemas.conversation import (
 from api.schemas.persona import AgentPersona, UserPersona
 
 from . import llm
+from .identity_cache import IdentityCache
+from .json_stream import JsonStringFieldExtractor
+
+# instructions come from the levels' state tables and are reused by every call
+# for the same state, so they are formatted once; names are substituted per call
+_INSTRUCTIONS: IdentityCache[MessageInstructions, str] = IdentityCache()
 
 
 def _format_example(
@@ -26,6 +34,10 @@ def _format_instructions(instructions: MessageInstructions | None) -> str:
     if not instructions:
         return ""
 
+    return _INSTRUCTIONS.get(instructions, _compile_instructions)
+
+
+def _compile_instructions(instructions: MessageInstructions) -> str:
     examples_str = (
         (
             "IMPORTANT: I MUST MODEL MY RESPONSE AFTER THE EXAMPLES BELOW.\n"
@@ -40,6 +52,41 @@ def _format_instructions(instructions: MessageInstructions | None) -> str:
     return f"\n{instructions.description}\n{examples_str}\n"
 
 
+async def _generate_streamed(
+    schema: type[llm.SchemaType],
+    model: llm.Model,
+    system: str,
+    prompt: str,
+    temperature: float,
+    on_delta: Callable[[str], Awaitable[None]],
+) -> llm.SchemaType:
+    extractor = JsonStringFieldExtractor("message")
+    chunks = []
+
+    try:
+        async for chunk in llm.generate_stream(
+            model=model, system=system, prompt=prompt, temperature=temperature
+        ):
+            chunks.append(chunk)
+            if text := extractor.feed(chunk):
+                await on_delta(text)
+
+        return llm.parse(schema, "".join(chunks))
+    except Exception as e:
+        # the final step carries the authoritative message, so clients replace
+        # whatever was streamed when this falls back
+        logging.warning(f"Streamed generation failed, retrying without: {e}")
+
+        return await llm.generate(
+            schema=schema,
+            model=model,
+            system=system,
+            prompt=prompt,
+            temperature=temperature,
+            cache=False,
+        )
+
+
 async def generate_message(
     user_sent: bool,
     user: UserPersona,
@@ -48,6 +95,7 @@ async def generate_message(
     scenario: BaseConversationScenario,
     instructions: MessageInstructions | None = None,
     feedback: str | None = None,
+    on_delta: Callable[[str], Awaitable[None]] | None = None,
 ) -> str:
     user_name = f"{user.name} (the user)" if user.name else "the user"
 
@@ -126,12 +174,20 @@ async def generate_message(
         "CAREFULLY TO ENSURE YOUR MESSAGE IS APPROPRIATE."
     )
 
-    response = await llm.generate(
-        schema=MessageWithRole,
-        model=instructions.model if instructions else llm.Model.CLAUDE_3_SONNET,
-        system=system_prompt,
-        prompt=prompt_data,
-        temperature=0.8,
-    )
+    model = instructions.model if instructions else llm.Model.CLAUDE_3_SONNET
+
+    if on_delta is not None:
+        response = await _generate_streamed(
+            MessageWithRole, model, system_prompt, prompt_data, 0.8, on_delta
+        )
+    else:
+        response = await llm.generate(
+            schema=MessageWithRole,
+            model=model,
+            system=system_prompt,
+            prompt=prompt_data,
+            temperature=0.8,
+            cache=False,
+        )
 
     return response.message
@@ -30,6 +30,7 @@ async def _extract_demographics(messages: list[QaMessage]) -> Demographics:
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return demographics
@@ -116,6 +117,7 @@ async def _get_cluster_topic(cluster: list[str]) -> str | None:
         model=llm.Model.CLAUDE_3_SONNET,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return response.topic
@@ -147,6 +149,7 @@ async def _get_interests_from_topics(topics: list[str]) -> list[str]:
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return response.interests
@@ -186,6 +189,7 @@ async def _extract_culture(messages: list[QaMessage]) -> str:
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return response.culture
@@ -211,6 +215,7 @@ async def _extract_writing_style(messages: list[QaMessage]) -> str:
         model=llm.Model.GPT_4,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return response.writing_style
@@ -235,6 +240,7 @@ async def _generate_user_persona(user_base: UserBasePersona):
         model=llm.Model.CLAUDE_3_SONNET,
         system=system_prompt,
         prompt=prompt_data,
+        priority=llm.Priority.ONBOARDING,
     )
 
     return UserPersona(**user_base.model_dump(), description=response.persona)
@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+import json
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import pytest
+import websockets as ws
+
+# api.services.llm refuses to import without a gateway to talk to; tests that
+# need one start their own
+os.environ.setdefault("LLM_URI", "ws://localhost:8765")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class Gateway:
+    # answers runModel actions with their prompt unless a test sets `respond`
+    def __init__(self):
+        self.actions: list[dict[str, Any]] = []
+        self.respond: Callable[[dict[str, Any]], Awaitable[Any]] = self._echo
+
+    @staticmethod
+    async def _echo(action: dict[str, Any]) -> Any:
+        return action["prompt"]
+
+    def prompts(self) -> list[str]:
+        return [action["prompt"] for action in self.actions]
+
+    async def handle(self, conn):
+        tasks = set()
+        async for raw in conn:
+            task = asyncio.create_task(self._answer(conn, json.loads(raw)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _answer(self, conn, action: dict[str, Any]):
+        self.actions.append(action)
+        try:
+            response = {"result": await self.respond(action)}
+        except Exception:
+            response = {"message": "Internal server error"}
+        response["requestId"] = action["requestId"]
+        with contextlib.suppress(ws.ConnectionClosed):
+            await conn.send(json.dumps(response))
+
+
+@pytest.fixture
+async def gateway(monkeypatch):
+    from api.services import llm
+    from api.services.llm_breaker import CircuitBreaker
+    from api.services.llm_cache import ResponseCache
+    from api.services.llm_hedging import HedgeBudget, LatencyTracker
+    from api.services.llm_limiter import AdaptiveLimiter
+    from api.services.llm_pool import ConnectionPool
+    from api.services.llm_singleflight import SingleFlight
+
+    gateway = Gateway()
+    server = await ws.serve(gateway.handle, "localhost", 0)
+    port = server.sockets[0].getsockname()[1]
+    pool = ConnectionPool(f"ws://localhost:{port}", max_size=4, max_streams=8)
+
+    # every test starts from fresh module state
+    monkeypatch.setattr(llm, "_POOL", pool)
+    monkeypatch.setattr(llm, "_CACHE", ResponseCache(max_entries=64, ttl=60))
+    monkeypatch.setattr(llm, "_SINGLEFLIGHT", SingleFlight())
+    monkeypatch.setattr(llm, "_HEDGE_BUDGET", HedgeBudget(1))
+    monkeypatch.setattr(
+        llm, "_LATENCIES", {model: LatencyTracker() for model in llm.Model}
+    )
+    monkeypatch.setattr(
+        llm, "_BREAKERS", {model: CircuitBreaker(model.name) for model in llm.Model}
+    )
+    monkeypatch.setattr(
+        llm,
+        "_GENERATE_LIMITERS",
+        {
+            vendor: AdaptiveLimiter(
+                initial=4,
+                weights={p.value: p.weight() for p in llm.Priority},
+            )
+            for vendor in llm.ModelVendor
+        },
+    )
+
+    try:
+        yield gateway
+    finally:
+        await pool.close()
+        server.close()
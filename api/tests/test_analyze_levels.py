@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from api.devtools import analyze_levels
+from api.levels.all import get_level_states
+from api.levels.states import FeedbackState
+from api.schemas.conversation import LEVEL_MAX, LEVEL_MIN, LevelConversationStage
+
+_LEVELS = range(LEVEL_MIN, LEVEL_MAX + 1)
+
+
+def test_bound_takes_the_cheapest_or_dearest_draws():
+    pool = [{"calls": 1}, {"calls": 3}, {"calls": 2}]
+
+    assert analyze_levels._bound(pool, 2, largest=False) == {"calls": 3}
+    assert analyze_levels._bound(pool, 2, largest=True) == {"calls": 5}
+
+
+@pytest.mark.parametrize("level", _LEVELS)
+def test_expected_costs_lie_within_their_range(level):
+    report = analyze_levels.analyze_level(level, analyze_levels._DEFAULT_LATENCY)
+
+    assert report.metrics["generate_message"].expected > 0
+    for metric in report.metrics.values():
+        assert metric.min <= metric.expected + 1e-9
+        assert metric.expected <= metric.max + 1e-9
+
+
+def _walk_elements(level: int, rng: random.Random) -> int:
+    states = get_level_states(LevelConversationStage(level=level))
+    elements, id = 0, states.init_id
+    while id is not None:
+        elements += 2 if isinstance(states.state(id), FeedbackState) else 1
+        id = rng.choice(states.targets(id))
+    return elements
+
+
+@pytest.mark.parametrize("level", _LEVELS)
+def test_walked_conversations_lie_within_the_range(level):
+    report = analyze_levels.analyze_level(level, analyze_levels._DEFAULT_LATENCY)
+    elements = report.metrics["elements"]
+    rng = random.Random(level)
+
+    walked = [_walk_elements(level, rng) for _ in range(200)]
+
+    assert elements.min <= min(walked)
+    assert max(walked) <= elements.max
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from api.db import auth_tokens, users
+from api.schemas.conversation import LevelConversationStage
+from api.schemas.persona import UserPersona
+from api.schemas.user import BaseUserData, UserData
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def _store(monkeypatch):
+    db = AsyncMongoMockClient().autsim
+    monkeypatch.setattr(auth_tokens, "auth_tokens", db.auth_tokens)
+    monkeypatch.setattr(users, "users", db.users)
+
+
+async def _user_with_token(secret: str):
+    persona = UserPersona(
+        age="30",
+        occupation="",
+        interests=[],
+        culture="",
+        writing_style="",
+        description="",
+    )
+    user = BaseUserData(qa_id=uuid.uuid4(), persona=persona)
+    # mongomock cannot encode UUIDs, which the real client does
+    res = await users.users.insert_one(user.model_dump(mode="json"))
+    user = UserData(id=res.inserted_id, **user.model_dump())
+    await auth_tokens.create(auth_tokens.AuthToken(secret=secret, user_id=user.id))
+    return user
+
+
+async def test_resolves_the_token_to_its_user():
+    user = await _user_with_token("secret")
+    await _user_with_token("other")
+
+    assert await auth_tokens.get_user("secret") == user
+    assert await auth_tokens.get_user("unknown") is None
+
+
+async def test_sees_changes_made_elsewhere():
+    user = await _user_with_token("secret")
+    await users.unlock_stage(user.id, LevelConversationStage(level=2))
+
+    resolved = await auth_tokens.get_user("secret")
+    assert resolved.max_unlocked_stage == LevelConversationStage(level=2)
+
+
+async def test_token_without_user():
+    user = await _user_with_token("secret")
+    await users.users.delete_one({"_id": user.id})
+
+    assert await auth_tokens.get_user("secret") is None
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from api.levels import level_1, level_2, level_3
+from api.levels.compiled import CompiledStates, UnknownStatePath
+from api.levels.states import State, UserState
+from api.schemas.conversation import state_path
+
+_LEVELS = [level_1.STATES, level_2.STATES, level_3.STATES]
+
+
+def _summary(state: State):
+    # the option data are compared by path, the compiled table links its own
+    if isinstance(state, UserState):
+        return [
+            (o.instructions, None if o.next is None else state_path(o.next))
+            for o in state.options
+        ]
+    data = getattr(state, "next", None)
+    return (
+        type(state),
+        state.model_dump(exclude={"next"}),
+        None if data is None else state_path(data),
+    )
+
+
+@pytest.mark.parametrize("tree", _LEVELS)
+def test_compiled_next_matches_recursive_evaluation(tree):
+    compiled = CompiledStates(tree)
+    walks = random.Random(0)
+
+    assert state_path(compiled.init()) == state_path(tree.init())
+
+    for _ in range(50):
+        data = compiled.init()
+        while data is not None:
+            seed = walks.random()
+            random.seed(seed)
+            expected = tree.next(data)
+            random.seed(seed)
+            from_data = compiled.next(data)
+            random.seed(seed)
+            from_path = compiled.next(state_path(data))
+
+            assert _summary(from_data) == _summary(expected)
+            assert _summary(from_path) == _summary(expected)
+
+            if isinstance(from_path, UserState):
+                data = walks.choice(from_path.options).next
+            else:
+                data = from_path.next
+
+
+@pytest.mark.parametrize("tree", _LEVELS)
+def test_every_reachable_state_matches_recursive_evaluation(tree):
+    compiled = CompiledStates(tree)
+
+    seen, pending = set(), [compiled.init()]
+    while pending:
+        data = pending.pop()
+        path = state_path(data)
+        if path in seen:
+            continue
+        seen.add(path)
+
+        random.seed(len(seen))
+        expected = tree.next(data)
+        random.seed(len(seen))
+        state = compiled.next(path)
+        assert _summary(state) == _summary(expected)
+
+        # every option, not only the sampled ones
+        state = compiled.state(compiled._ids[path])
+        leads = state.options if isinstance(state, UserState) else [state]
+        pending += [lead.next for lead in leads if lead.next is not None]
+
+    assert len(seen) > 10
+
+
+def test_unknown_state_path_falls_back_to_the_tree():
+    compiled = CompiledStates(level_1.STATES)
+    path = state_path(compiled.init())
+    compiled._ids.pop(path)
+
+    random.seed(0)
+    expected = level_1.STATES.next(compiled.init())
+    random.seed(0)
+
+    assert _summary(compiled.next(path)) == _summary(expected)
+
+
+@pytest.mark.parametrize("path", [(), (99,), (0, "not a state")])
+def test_state_path_unknown_to_the_tree(path):
+    compiled = CompiledStates(level_1.STATES)
+
+    with pytest.raises(UnknownStatePath):
+        compiled.next(path)
@@ -0,0 +1,100 @@
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from api.db import conversations
+from api.db.indexes import COLLECTIONS
+from api.schemas.conversation import (
+    ApMessageLogEntry,
+    BaseConversation,
+    LevelConversationInfo,
+    LevelConversationScenario,
+    MessageElement,
+    StateActiveData,
+    UserMessage,
+)
+from api.schemas.persona import AgentPersona
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+async def _store(monkeypatch):
+    db = AsyncMongoMockClient().autsim
+    await db.conversation_history.create_indexes(
+        COLLECTIONS["conversation_history"].indexes
+    )
+    monkeypatch.setattr(conversations, "conversations", db.conversations)
+    monkeypatch.setattr(conversations, "conversation_history", db.conversation_history)
+
+
+def _conversation(user_id: ObjectId) -> BaseConversation:
+    return BaseConversation(
+        user_id=user_id,
+        info=LevelConversationInfo(
+            level=1,
+            scenario=LevelConversationScenario(
+                user_perspective="",
+                agent_perspective="",
+                user_goal="",
+                is_user_initiated=True,
+            ),
+        ),
+        agent=AgentPersona(
+            name="Jordan", age="30", occupation="", interests=[], description=""
+        ),
+        state=StateActiveData(data=None),
+    )
+
+
+def _message(text: str) -> MessageElement:
+    return MessageElement(content=UserMessage(message=text))
+
+
+async def _step(conversation, text: str):
+    conversation.events.append(ApMessageLogEntry(message=text))
+    conversation.elements.append(_message(text))
+    await conversations.update(conversation)
+
+
+async def _messages(conversation_id: ObjectId) -> list[str]:
+    elements = await conversations.get_elements(conversation_id)
+    return [e.content.message for e in elements]
+
+
+async def test_update_appends_history():
+    user_id = ObjectId()
+    conversation = await conversations.insert(_conversation(user_id))
+
+    for i in range(3):
+        await _step(conversation, f"message {i}")
+
+    assert await _messages(conversation.id) == ["message 0", "message 1", "message 2"]
+    assert await conversations.conversation_history.count_documents({}) == 6
+
+
+async def test_failed_history_write_is_recovered(monkeypatch):
+    user_id = ObjectId()
+    conversation = await conversations.insert(_conversation(user_id))
+    await _step(conversation, "message 0")
+
+    append = conversations._append_history
+
+    async def fail(entries):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(conversations, "_append_history", fail)
+    with pytest.raises(RuntimeError):
+        await _step(conversation, "message 1")
+    monkeypatch.setattr(conversations, "_append_history", append)
+
+    # the head has moved on, the entries it keeps fill the gap
+    assert await _messages(conversation.id) == ["message 0", "message 1"]
+
+    conversation = await conversations.get(conversation.id, user_id)
+    assert conversation is not None
+    await _step(conversation, "message 2")
+
+    history = conversations.conversation_history.find({}, {"_id": 0, "seq": 1})
+    assert [e["seq"] async for e in history.sort("seq", 1)] == list(range(6))
+    assert await _messages(conversation.id) == ["message 0", "message 1", "message 2"]
@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from api.db import conversations, warm_conversations
+from api.schemas.conversation import (
+    BaseConversation,
+    LevelConversationInfo,
+    LevelConversationScenario,
+    LevelConversationStage,
+    StateActiveData,
+)
+from api.schemas.persona import AgentPersona, UserPersona
+from api.schemas.user import UserData
+from api.services import conversation_handler, conversation_pool
+
+pytestmark = pytest.mark.anyio
+
+_STAGE = LevelConversationStage(level=1)
+
+
+@pytest.fixture(autouse=True)
+def _store(monkeypatch):
+    db = AsyncMongoMockClient().autsim
+    monkeypatch.setattr(warm_conversations, "warm_conversations", db.warm)
+    monkeypatch.setattr(warm_conversations, "warm_conversation_fills", db.fills)
+    monkeypatch.setattr(conversation_pool, "WARM_POOL_SIZE", 2)
+
+
+def _user(name: str | None = None) -> UserData:
+    persona = UserPersona(
+        name=name,
+        age="30",
+        occupation="",
+        interests=[],
+        culture="",
+        writing_style="",
+        description="",
+    )
+    return UserData(id=ObjectId(), qa_id=uuid.uuid4(), persona=persona)
+
+
+class _Builder:
+    def __init__(self):
+        self.built = 0
+
+    async def __call__(self, user, stage) -> BaseConversation:
+        self.built += 1
+        number = self.built
+        await asyncio.sleep(0.01 * number)
+        return BaseConversation(
+            user_id=user.id,
+            info=LevelConversationInfo(
+                level=1,
+                scenario=LevelConversationScenario(
+                    user_perspective=f"scenario {number}",
+                    agent_perspective="",
+                    user_goal="",
+                    is_user_initiated=True,
+                ),
+            ),
+            agent=AgentPersona(
+                name="Jordan", age="30", occupation="", interests=[], description=""
+            ),
+            state=StateActiveData(data=None),
+        )
+
+
+async def test_fill_builds_up_to_the_pool_size():
+    user, build = _user(), _Builder()
+
+    await conversation_pool.fill(user, _STAGE, build)
+    await conversation_pool.fill(user, _STAGE, build)
+
+    assert build.built == 2
+    assert not await conversation_pool.needs_fill(user, _STAGE)
+
+
+async def test_claim_takes_the_oldest_conversation():
+    user, build = _user(), _Builder()
+    await conversation_pool.fill(user, _STAGE, build)
+
+    first = await conversation_pool.claim(user, _STAGE)
+
+    assert first.info.scenario.user_perspective == "scenario 1"
+    assert await conversation_pool.needs_fill(user, _STAGE)
+
+
+async def test_changed_persona_invalidates_the_pool():
+    user, build = _user(), _Builder()
+    await conversation_pool.fill(user, _STAGE, build)
+
+    renamed = user.model_copy(update={"persona": _user("Alex").persona})
+
+    assert await conversation_pool.claim(renamed, _STAGE) is None
+
+
+async def test_concurrent_fills_build_once():
+    user, build = _user(), _Builder()
+
+    await asyncio.gather(
+        *[conversation_pool.fill(user, _STAGE, build) for _ in range(3)]
+    )
+
+    assert build.built == 2
+
+
+async def test_disabled_pool_builds_nothing(monkeypatch):
+    monkeypatch.setattr(conversation_pool, "WARM_POOL_SIZE", 0)
+    user, build = _user(), _Builder()
+
+    await conversation_pool.fill(user, _STAGE, build)
+
+    assert build.built == 0
+    assert await conversation_pool.claim(user, _STAGE) is None
+
+
+@pytest.mark.parametrize("warm", [True, False])
+async def test_pool_is_refilled_only_after_a_claim(monkeypatch, warm):
+    user, build = _user(), _Builder()
+    if warm:
+        await conversation_pool.fill(user, _STAGE, build)
+
+    scheduled = []
+    monkeypatch.setattr(conversation_handler, "_build_conversation", build)
+    monkeypatch.setattr(
+        conversation_pool, "schedule_fill", lambda *args: scheduled.append(args)
+    )
+    monkeypatch.setattr(conversations, "insert", _insert)
+
+    await conversation_handler.create_conversation(user, _STAGE)
+
+    assert len(scheduled) == (1 if warm else 0)
+
+
+async def _insert(conversation: BaseConversation):
+    return conversation.model_copy(update={"id": ObjectId()})
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from api.services import llm
+from api.services.conversation_speculation import Speculator
+
+pytestmark = pytest.mark.anyio
+
+
+class _Branch:
+    def __init__(self, result: str, fail: bool = False):
+        self.result = result
+        self.fail = fail
+        self.finish = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self) -> str:
+        try:
+            await self.finish.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError("generation failed")
+        return self.result
+
+
+async def test_taken_branch_is_returned_and_the_rest_cancelled():
+    speculator = Speculator()
+    a, b = _Branch("a"), _Branch("b")
+    speculator.start("conversation", {"a": a, "b": b})
+    await asyncio.sleep(0)
+
+    a.finish.set()
+    assert await speculator.take("conversation", "a") == "a"
+    await asyncio.sleep(0)
+
+    assert b.cancelled
+    stats = speculator.stats()
+    assert (stats.hits, stats.cancelled, stats.pending) == (1, 1, 0)
+
+
+async def test_unknown_branch_is_a_miss():
+    speculator = Speculator()
+    a = _Branch("a")
+    speculator.start("conversation", {"a": a})
+    await asyncio.sleep(0)
+
+    assert await speculator.take("conversation", "other") is None
+    assert await speculator.take("unknown", "a") is None
+    await asyncio.sleep(0)
+
+    assert a.cancelled
+    assert speculator.stats().misses == 1
+
+
+async def test_failed_branch_is_a_miss():
+    speculator = Speculator()
+    a = _Branch("a", fail=True)
+    speculator.start("conversation", {"a": a})
+    a.finish.set()
+
+    assert await speculator.take("conversation", "a") is None
+    assert speculator.stats().misses == 1
+
+
+async def test_branches_expire():
+    speculator = Speculator(ttl=0.01)
+    a = _Branch("a")
+    speculator.start("conversation", {"a": a})
+
+    await asyncio.sleep(0.05)
+
+    assert a.cancelled
+    assert await speculator.take("conversation", "a") is None
+
+
+async def test_taken_branch_runs_at_interactive_priority():
+    speculator = Speculator()
+    finish = asyncio.Event()
+
+    async def branch() -> llm.Priority:
+        await finish.wait()
+        return llm._PRIORITY.get().priority
+
+    speculator.start("conversation", {"a": branch})
+    taken = asyncio.create_task(speculator.take("conversation", "a"))
+    await asyncio.sleep(0)
+    finish.set()
+
+    assert await taken == llm.Priority.INTERACTIVE
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import TypeAdapter
+
+from api.db import idempotency_keys
+from api.services import idempotency
+
+pytestmark = pytest.mark.anyio
+
+_ADAPTER = TypeAdapter(str)
+
+
+@pytest.fixture(autouse=True)
+def _store(monkeypatch):
+    collection = AsyncMongoMockClient().autsim.idempotency_keys
+    monkeypatch.setattr(idempotency_keys, "idempotency_keys", collection)
+    monkeypatch.setattr(idempotency, "_POLL_INTERVAL", 0.01)
+
+
+class _Request:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        self.started.set()
+        await self.finish.wait()
+        if self.fail:
+            raise RuntimeError("request failed")
+        return f"response {self.calls}"
+
+
+def _run(user_id: ObjectId, fn, request: str = "request"):
+    return idempotency.run(user_id, "scope", "key", request, fn, _ADAPTER)
+
+
+async def test_retry_replays_the_response():
+    user_id = ObjectId()
+    original = _Request()
+    retry = _Request()
+
+    first = asyncio.create_task(_run(user_id, original))
+    await original.started.wait()
+    second = asyncio.create_task(_run(user_id, retry))
+    await asyncio.sleep(0.05)
+    original.finish.set()
+
+    assert await first == "response 1"
+    assert await second == "response 1"
+    assert retry.calls == 0
+
+
+async def test_retry_runs_again_after_the_original_fails():
+    user_id = ObjectId()
+    original = _Request(fail=True)
+    retry = _Request()
+    retry.finish.set()
+
+    first = asyncio.create_task(_run(user_id, original))
+    await original.started.wait()
+    second = asyncio.create_task(_run(user_id, retry))
+    await asyncio.sleep(0.05)
+    original.finish.set()
+
+    with pytest.raises(RuntimeError):
+        await first
+    assert await second == "response 1"
+    assert retry.calls == 1
+
+    # the retry's response is now the one replayed
+    assert await _run(user_id, _Request()) == "response 1"
+
+
+async def test_key_reused_for_another_request():
+    user_id = ObjectId()
+    original = _Request()
+    original.finish.set()
+    await _run(user_id, original)
+
+    with pytest.raises(idempotency.IdempotencyKeyReused):
+        await _run(user_id, _Request(), request="another request")
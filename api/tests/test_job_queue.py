@@ -0,0 +1,144 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from api.db import jobs
+from api.services.job_queue import JobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def _store(monkeypatch):
+    monkeypatch.setattr(jobs, "jobs", AsyncMongoMockClient().autsim.jobs)
+
+
+def _queue(**options) -> JobQueue:
+    return JobQueue(1, poll_interval=0.01, backoff=0.01, **options)
+
+
+async def _until(condition, timeout: float = 1):
+    async with asyncio.timeout(timeout):
+        while not await condition():
+            await asyncio.sleep(0.01)
+
+
+async def _status(name: str) -> str | None:
+    job = await jobs.jobs.find_one({"_id": name})
+    return job["status"] if job else None
+
+
+async def test_job_runs_and_is_removed():
+    queue = _queue()
+    ran = []
+
+    async def handler(payload):
+        ran.append(payload)
+
+    queue.register("kind", handler)
+    queue.start()
+    try:
+        assert await queue.enqueue("job", "kind", {"n": 1})
+        await _until(lambda: _gone("job"))
+    finally:
+        await queue.drain()
+
+    assert ran == [{"n": 1}]
+    assert queue.stats().completed == 1
+
+
+async def test_queued_job_is_deduplicated_by_name():
+    queue = _queue()
+    queue.register("kind", _noop)
+
+    assert await queue.enqueue("job", "kind", {})
+    assert not await queue.enqueue("job", "kind", {})
+    assert queue.stats().deduplicated == 1
+
+
+async def test_failing_job_is_retried_then_expires():
+    queue = _queue(max_attempts=2, failed_ttl=60)
+    attempts = 0
+
+    async def handler(_):
+        nonlocal attempts
+        attempts += 1
+        raise RuntimeError("failed")
+
+    queue.register("kind", handler)
+    await queue.enqueue("job", "kind", {})
+    queue.start()
+    try:
+        await _until(lambda: _has_status("job", "failed"))
+    finally:
+        await queue.drain()
+
+    job = await jobs.jobs.find_one({"_id": "job"})
+    assert attempts == 2
+    assert job["last_error"] == "failed"
+    assert job["expires_at"] > datetime.now(UTC).replace(tzinfo=None)
+
+    # a job that gave up may be queued again
+    assert await queue.enqueue("job", "kind", {})
+    assert (await jobs.jobs.find_one({"_id": "job"}))["expires_at"] is None
+
+
+async def test_expired_lease_is_reclaimed():
+    queue = _queue()
+    ran = []
+
+    async def handler(payload):
+        ran.append(payload)
+
+    queue.register("kind", handler)
+    await queue.enqueue("job", "kind", {"n": 1})
+
+    # a worker claimed the job and went away
+    claimed = await jobs.claim(["kind"], lease=60)
+    assert claimed["_id"] == "job"
+    assert await jobs.claim(["kind"], lease=60) is None
+    await jobs.jobs.update_one(
+        {"_id": "job"},
+        {"$set": {"leased_until": datetime.now(UTC) - timedelta(seconds=1)}},
+    )
+
+    queue.start()
+    try:
+        await _until(lambda: _gone("job"))
+    finally:
+        await queue.drain()
+
+    assert ran == [{"n": 1}]
+
+
+async def test_drain_hands_running_jobs_back():
+    queue = _queue()
+    started = asyncio.Event()
+
+    async def handler(_):
+        started.set()
+        await asyncio.sleep(10)
+
+    queue.register("kind", handler)
+    await queue.enqueue("job", "kind", {})
+    queue.start()
+    await started.wait()
+
+    await queue.drain(timeout=0.01)
+
+    job = await jobs.jobs.find_one({"_id": "job"})
+    assert (job["status"], job["attempts"]) == ("pending", 0)
+
+
+async def _noop(_):
+    pass
+
+
+async def _gone(name: str) -> bool:
+    return await _status(name) is None
+
+
+async def _has_status(name: str, status: str) -> bool:
+    return await _status(name) == status
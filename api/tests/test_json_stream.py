@@ -0,0 +1,88 @@
+import json
+import random
+
+import pytest
+
+from api.services.json_stream import JsonStringFieldExtractor
+
+
+def _extract(text: str, field: str, sizes: list[int]) -> str:
+    extractor = JsonStringFieldExtractor(field)
+    out, i = [], 0
+    for size in sizes:
+        out.append(extractor.feed(text[i : i + size]))
+        i += size
+    out.append(extractor.feed(text[i:]))
+    return "".join(out)
+
+
+def _chunkings(text: str) -> list[list[int]]:
+    rng = random.Random(0)
+    return [
+        [1] * len(text),
+        [len(text)],
+        *[[rng.randint(1, 6) for _ in range(len(text))] for _ in range(20)],
+    ]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Hi there!",
+        "",
+        'She said "hi" \\ then left/ran\n\ttabbed',
+        "café ☃ \U0001f600 你好",
+        "\b\f\r control",
+    ],
+)
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_extracts_field_across_chunk_boundaries(message: str, ensure_ascii: bool):
+    text = json.dumps({"sender": "Alex", "message": message}, ensure_ascii=ensure_ascii)
+
+    for sizes in _chunkings(text):
+        assert _extract(text, "message", sizes) == message
+
+
+def test_ignores_preamble_and_trailing_text():
+    text = 'Sure! Here is the JSON: {"message": "hello"} Anything else?'
+
+    assert _extract(text, "message", [3] * len(text)) == "hello"
+
+
+def test_ignores_nested_fields_with_the_same_name():
+    text = json.dumps(
+        {
+            "meta": {"message": "nested", "list": [{"message": "deeper"}]},
+            "notes": ["message", "message"],
+            "message": "top level",
+        }
+    )
+
+    for sizes in _chunkings(text):
+        assert _extract(text, "message", sizes) == "top level"
+
+
+def test_ignores_string_values_equal_to_the_field_name():
+    text = '{"kind": "message", "message": "value"}'
+
+    assert _extract(text, "message", [1] * len(text)) == "value"
+
+
+def test_non_string_value_is_not_captured():
+    text = '{"message": null, "other": "text"}'
+
+    assert _extract(text, "message", [1] * len(text)) == ""
+
+
+def test_escaped_key_is_decoded():
+    text = '{"mess\\u0061ge": "decoded"}'
+
+    assert _extract(text, "message", [1] * len(text)) == "decoded"
+
+
+def test_stops_after_the_value():
+    extractor = JsonStringFieldExtractor("message")
+
+    assert extractor.feed('{"message": "one"') == "one"
+    assert extractor.done
+    assert extractor.feed(', "message": "two"}') == ""
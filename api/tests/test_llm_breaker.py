@@ -0,0 +1,102 @@
+import pytest
+
+from api.services import llm
+from api.services.llm_breaker import CircuitBreaker, CircuitOpen, CircuitState
+
+pytestmark = pytest.mark.anyio
+
+_MODEL = llm.Model.GPT_4
+
+
+def _fail(breaker: CircuitBreaker):
+    with pytest.raises(RuntimeError), breaker.call():
+        raise RuntimeError("failed")
+
+
+def _half_open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        _fail(breaker)
+    breaker._opened_at -= breaker.reset_timeout
+
+
+async def test_consumer_closing_a_stream_releases_the_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    _half_open(breaker)
+
+    async def stream():
+        with breaker.call():
+            yield "first"
+            yield "second"
+
+    deltas = stream()
+    assert await anext(deltas) == "first"
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpen), breaker.call():
+        pass
+
+    await deltas.aclose()
+
+    with breaker.call():
+        pass
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_consecutive_failures_open_the_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=3)
+    for _ in range(2):
+        _fail(breaker)
+    with breaker.call():
+        pass
+    for _ in range(2):
+        _fail(breaker)
+    assert breaker.state == CircuitState.CLOSED
+
+    _fail(breaker)
+
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpen), breaker.call():
+        pass
+    assert breaker.stats().rejected == 1
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    _half_open(breaker)
+    _fail(breaker)
+    assert breaker.state == CircuitState.OPEN
+
+    breaker._opened_at -= breaker.reset_timeout
+    with breaker.call():
+        pass
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_ignored_errors_do_not_count():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+
+    with pytest.raises(ConnectionError), breaker.call(ignore=(ConnectionError,)):
+        raise ConnectionError()
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def _open(model: llm.Model):
+    breaker = llm._BREAKERS[model]
+    for _ in range(breaker.failure_threshold):
+        _fail(breaker)
+
+
+async def test_open_circuit_fails_fast(gateway):
+    _open(_MODEL)
+
+    with pytest.raises(CircuitOpen):
+        await llm.generate(None, _MODEL, "prompt", "system")
+    assert gateway.actions == []
+
+
+async def test_open_circuit_reroutes_to_the_fallback(gateway, monkeypatch):
+    monkeypatch.setattr(llm, "_BREAKER_REROUTE", True)
+    _open(_MODEL)
+
+    assert await llm.generate(None, _MODEL, "prompt", "system") == "prompt"
+    assert [action["model"] for action in gateway.actions] == [_MODEL.fallback().value]
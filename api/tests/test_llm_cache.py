@@ -0,0 +1,94 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import BaseModel
+
+from api.db import llm_cache as llm_cache_store
+from api.services import llm
+from api.services.llm_cache import ResponseCache, request_key
+
+pytestmark = pytest.mark.anyio
+
+_MODEL = llm.Model.GPT_4
+
+
+class _Reply(BaseModel):
+    text: str
+
+
+def _identity(value):
+    return value
+
+
+def test_request_key_ignores_argument_order():
+    assert request_key(a=1, b=[1, 2]) == request_key(b=[1, 2], a=1)
+    assert request_key(a=1) != request_key(a=2)
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    await cache.set("a", 1, _identity)
+    await cache.set("b", 2, _identity)
+    await cache.get("a", _identity)
+    await cache.set("c", 3, _identity)
+
+    assert await cache.get("a", _identity) == 1
+    assert await cache.get("b", _identity) is None
+    assert await cache.get("c", _identity) == 3
+
+
+async def test_expired_entry_is_a_miss():
+    cache = ResponseCache(max_entries=2, ttl=-1)
+    await cache.set("a", 1, _identity)
+
+    assert await cache.get("a", _identity) is None
+    assert cache.stats().misses == 1
+
+
+async def test_entries_are_shared_through_the_store(monkeypatch):
+    collection = AsyncMongoMockClient().autsim.llm_cache
+    monkeypatch.setattr(llm_cache_store, "llm_cache", collection)
+
+    await ResponseCache(8, 60, llm_cache_store).set("a", {"text": "hi"}, _identity)
+    other = ResponseCache(8, 60, llm_cache_store)
+
+    assert await other.get("a", _Reply.model_validate) == _Reply(text="hi")
+    assert other.stats().store_hits == 1
+
+
+async def test_cached_generate_calls_the_model_once(gateway):
+    gateway.respond = lambda action: _reply(action["prompt"])
+
+    first = await llm.generate(_Reply, _MODEL, "prompt", "system", cache=True)
+    first.text = "changed by the caller"
+    second = await llm.generate(_Reply, _MODEL, "prompt", "system", cache=True)
+
+    assert second == _Reply(text="prompt")
+    assert gateway.prompts() == ["prompt"]
+
+
+async def test_uncached_generate_calls_the_model_every_time(gateway):
+    gateway.respond = lambda action: _reply(action["prompt"])
+
+    for _ in range(2):
+        await llm.generate(_Reply, _MODEL, "prompt", "system", cache=False)
+
+    assert gateway.prompts() == ["prompt", "prompt"]
+
+
+async def test_sampled_uncached_generate_builds_no_key(gateway, monkeypatch):
+    gateway.respond = lambda action: _reply(action["prompt"])
+
+    def request_key(**_):
+        raise AssertionError("key built for an uncached sampled call")
+
+    monkeypatch.setattr(llm, "request_key", request_key)
+
+    reply = await llm.generate(
+        _Reply, _MODEL, "prompt", "system", temperature=0.7, cache=False
+    )
+
+    assert reply == _Reply(text="prompt")
+
+
+async def _reply(text: str) -> str:
+    return _Reply(text=text).model_dump_json()
@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from api.services import llm
+from api.services.llm_hedging import HedgeBudget, LatencyTracker
+
+pytestmark = pytest.mark.anyio
+
+_MODEL = llm.Model.GPT_4
+
+
+def _seed_latency(latency: float):
+    tracker = llm._LATENCIES[_MODEL]
+    for _ in range(tracker.min_samples):
+        tracker.record(latency)
+
+
+def test_percentile_needs_enough_samples():
+    tracker = LatencyTracker(min_samples=4)
+    for latency in (0.3, 0.1, 0.2):
+        tracker.record(latency)
+    assert tracker.percentile(95) is None
+
+    tracker.record(0.4)
+    assert tracker.percentile(50) == 0.2
+    assert tracker.percentile(95) == 0.4
+
+
+def test_budget_caps_the_fraction_of_hedged_requests():
+    budget = HedgeBudget(0.25)
+    spent = 0
+    for _ in range(8):
+        budget.record_request()
+        spent += budget.try_spend()
+
+    assert spent == 2
+    assert budget.stats().budget_denied == 6
+
+
+async def test_slow_call_is_hedged(gateway):
+    _seed_latency(0.02)
+    calls = 0
+
+    async def respond(action):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(1)
+        return f"reply {calls}"
+
+    gateway.respond = respond
+
+    result = await llm._generate_hedged(None, _MODEL, "prompt", "system")
+
+    assert result == "reply 2"
+    assert llm._HEDGE_BUDGET.stats().hedged == 1
+    assert llm._HEDGE_BUDGET.stats().hedge_wins == 1
+
+
+async def test_call_waiting_for_a_slot_is_not_hedged(gateway):
+    _seed_latency(0.02)
+    limiter = llm._GENERATE_LIMITERS[_MODEL.vendor()]
+
+    async def hold_slots():
+        async with contextlib.AsyncExitStack() as stack:
+            for _ in range(limiter.limit):
+                await stack.enter_async_context(limiter.slot("interactive"))
+            await asyncio.sleep(0.2)
+
+    holding = asyncio.create_task(hold_slots())
+    await asyncio.sleep(0)
+
+    result = await llm._generate_hedged(None, _MODEL, "prompt", "system")
+    await holding
+
+    assert result == "prompt"
+    assert gateway.prompts() == ["prompt"]
+    assert llm._HEDGE_BUDGET.stats().hedged == 0
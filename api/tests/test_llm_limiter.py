@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from api.services.llm_limiter import AdaptiveLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+async def _grant_order(limiter: AdaptiveLimiter, waiters: dict[str, object]):
+    order = []
+
+    async def wait(name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+
+    tasks = [asyncio.create_task(wait(n, p)) for n, p in waiters.items()]
+    await asyncio.sleep(0)
+    return order, tasks
+
+
+async def test_raised_waiter_moves_to_the_new_queue():
+    limiter = AdaptiveLimiter(initial=1, weights={"interactive": 6, "pregeneration": 2})
+    priority = "pregeneration"
+
+    await limiter.acquire("interactive")
+    order, tasks = await _grant_order(
+        limiter,
+        {
+            "first": "pregeneration",
+            "second": "pregeneration",
+            "raised": lambda: priority,
+        },
+    )
+    assert limiter.stats().queues["pregeneration"].queue_depth == 3
+
+    priority = "interactive"
+    limiter.reprioritize()
+    assert limiter.stats().queues["interactive"].queue_depth == 1
+
+    limiter.release(0.1, error=False)
+    await asyncio.gather(*tasks)
+
+    # the interactive class spent its share on the slot held before
+    assert order == ["first", "raised", "second"]
+
+
+async def test_cancelled_raised_waiter_leaves_its_queue():
+    limiter = AdaptiveLimiter(initial=1, weights={"interactive": 6, "pregeneration": 2})
+    priority = "pregeneration"
+
+    await limiter.acquire("interactive")
+    _, [task] = await _grant_order(limiter, {"raised": lambda: priority})
+    priority = "interactive"
+    limiter.reprioritize()
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert limiter.stats().queue_depth == 0
@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+import websockets as ws
+
+from api.services.llm_pool import ConnectionPool, ConnectionRetired
+
+pytestmark = pytest.mark.anyio
+
+
+class _Gateway:
+    # answers {"prompt": ..., "delay": ...} actions with their prompt as result
+    def __init__(self, echo_request_id: bool):
+        self.echo_request_id = echo_request_id
+        self.connections = 0
+
+    async def handle(self, conn):
+        self.connections += 1
+        tasks = set()
+        async for raw in conn:
+            task = asyncio.create_task(self._answer(conn, json.loads(raw)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _answer(self, conn, action):
+        await asyncio.sleep(action.get("delay", 0))
+        if action["prompt"] == "ise":
+            response = {"message": "Internal server error"}
+        else:
+            response = {"result": action["prompt"]}
+            if self.echo_request_id:
+                response["requestId"] = action["requestId"]
+        # the client may have given up on the socket
+        with contextlib.suppress(ws.ConnectionClosed):
+            await conn.send(json.dumps(response))
+
+
+async def _serve(gateway: _Gateway):
+    server = await ws.serve(gateway.handle, "localhost", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://localhost:{port}"
+
+
+async def _run(pool: ConnectionPool, prompt: str, delay: float = 0) -> str:
+    async with pool.session({"prompt": prompt, "delay": delay}) as stream:
+        return (await stream.recv())["result"]
+
+
+async def test_replies_are_routed_by_request_id():
+    server, uri = await _serve(_Gateway(echo_request_id=True))
+    pool = ConnectionPool(uri, max_size=1, max_streams=8)
+    try:
+        # the first reply lets the pool trust the socket with more streams
+        assert await _run(pool, "warmup") == "warmup"
+
+        prompts = [f"prompt {i}" for i in range(8)]
+        # later requests are answered first
+        results = await asyncio.gather(
+            *[_run(pool, p, delay=0.05 * (8 - i)) for i, p in enumerate(prompts)]
+        )
+
+        assert results == prompts
+        assert pool.stats().size == 1
+    finally:
+        await pool.close()
+        server.close()
+
+
+async def test_late_reply_is_dropped():
+    server, uri = await _serve(_Gateway(echo_request_id=True))
+    pool = ConnectionPool(uri, max_size=1, max_streams=8)
+    try:
+        await _run(pool, "warmup")
+
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.05):
+                await _run(pool, "slow", delay=0.2)
+
+        result = await _run(pool, "fast", delay=0.3)
+
+        assert result == "fast"
+    finally:
+        await pool.close()
+        server.close()
+
+
+async def test_unanswered_request_retires_socket_without_request_ids():
+    gateway = _Gateway(echo_request_id=False)
+    server, uri = await _serve(gateway)
+    pool = ConnectionPool(uri, max_size=1, max_streams=8)
+    try:
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.05):
+                await _run(pool, "slow", delay=0.2)
+
+        result = await _run(pool, "fast", delay=0.3)
+
+        assert result == "fast"
+        assert gateway.connections == 2
+    finally:
+        await pool.close()
+        server.close()
+
+
+async def test_answered_requests_reuse_socket_without_request_ids():
+    gateway = _Gateway(echo_request_id=False)
+    server, uri = await _serve(gateway)
+    pool = ConnectionPool(uri, max_size=1, max_streams=8)
+    try:
+        results = await asyncio.gather(*[_run(pool, f"{i}") for i in range(4)])
+
+        assert results == ["0", "1", "2", "3"]
+        assert gateway.connections == 1
+        assert pool.stats().multiplexed == 0
+    finally:
+        await pool.close()
+        server.close()
+
+
+async def test_untagged_error_retires_multiplexed_socket():
+    server, uri = await _serve(_Gateway(echo_request_id=True))
+    pool = ConnectionPool(uri, max_size=1, max_streams=8)
+    try:
+        await _run(pool, "warmup")
+
+        results = await asyncio.gather(
+            _run(pool, "ise"), _run(pool, "other", delay=0.2), return_exceptions=True
+        )
+
+        assert [type(r) for r in results] == [ConnectionRetired, ConnectionRetired]
+        assert await _run(pool, "after") == "after"
+    finally:
+        await pool.close()
+        server.close()
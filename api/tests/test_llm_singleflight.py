@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from api.services import llm
+from api.services.llm_singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+_MODEL = llm.Model.GPT_4
+
+
+class _Call:
+    def __init__(self):
+        self.calls = 0
+        self.finish = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.finish.wait()
+        return "result"
+
+
+async def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    call = _Call()
+
+    callers = [asyncio.create_task(flight.do("key", call)) for _ in range(3)]
+    await asyncio.sleep(0)
+    call.finish.set()
+
+    results = await asyncio.gather(*callers)
+
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert call.calls == 1
+    assert flight.stats().in_flight == 0
+
+
+async def test_call_survives_one_caller_going_away():
+    flight = SingleFlight()
+    call = _Call()
+
+    leader = asyncio.create_task(flight.do("key", call))
+    follower = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    call.finish.set()
+
+    assert await follower == ("result", True)
+
+
+async def test_last_caller_going_away_cancels_the_call():
+    flight = SingleFlight()
+    call = _Call()
+
+    caller = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.sleep(0.01)
+
+    assert flight.stats().in_flight == 0
+
+
+async def _slow_echo(action):
+    await asyncio.sleep(0.05)
+    return action["prompt"]
+
+
+async def test_identical_generate_calls_are_coalesced(gateway):
+    gateway.respond = _slow_echo
+
+    results = await asyncio.gather(
+        *[llm.generate(None, _MODEL, "prompt", "system") for _ in range(3)]
+    )
+
+    assert results == ["prompt"] * 3
+    assert gateway.prompts() == ["prompt"]
+
+
+async def test_sampled_generate_calls_are_not_coalesced(gateway):
+    gateway.respond = _slow_echo
+
+    await asyncio.gather(
+        *[
+            llm.generate(None, _MODEL, "prompt", "system", temperature=0.7)
+            for _ in range(3)
+        ]
+    )
+
+    assert gateway.prompts() == ["prompt"] * 3
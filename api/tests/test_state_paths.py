@@ -0,0 +1,85 @@
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import ValidationError
+
+from api.db import conversations
+from api.levels import level_1
+from api.schemas.conversation import (
+    STATE_PATH_VERSION,
+    StateActiveData,
+    state_path,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def _store(monkeypatch):
+    db = AsyncMongoMockClient().autsim
+    monkeypatch.setattr(conversations, "conversations", db.conversations)
+    monkeypatch.setattr(conversations, "conversation_history", db.conversation_history)
+
+
+def _nested() -> dict:
+    # stored state data before state paths: nested models of every combinator
+    return level_1.STATES.init().model_dump()
+
+
+def test_state_path_reads_models_and_dicts():
+    data = level_1.STATES.init()
+
+    assert state_path(data) == state_path(data.model_dump())
+    assert len(state_path(data)) > 1
+
+
+def test_state_path_round_trip():
+    path = state_path(_nested())
+    dumped = StateActiveData(data=path).model_dump()
+
+    assert dumped["data"] == [STATE_PATH_VERSION, *path]
+    assert StateActiveData.model_validate(dumped).data == path
+
+
+def test_nested_data_is_read_as_a_state_path():
+    state = StateActiveData.model_validate({"data": _nested()})
+
+    assert state.data == state_path(_nested())
+
+
+def test_unknown_state_path_version_is_rejected():
+    with pytest.raises(ValidationError):
+        StateActiveData.model_validate({"data": [STATE_PATH_VERSION + 1, 0]})
+
+
+async def test_migrate_state_paths():
+    nested, path = _nested(), state_path(_nested())
+    conversation_id = ObjectId()
+    await conversations.conversations.insert_one(
+        {
+            "_id": conversation_id,
+            "version": 3,
+            "state": {"type": "active", "data": nested},
+        }
+    )
+    await conversations.conversation_history.insert_one(
+        {
+            "conversation_id": conversation_id,
+            "seq": 0,
+            "kind": "event",
+            "entry": {
+                "type": "np_options",
+                "options": [{"response": "hi", "next": nested}],
+            },
+        }
+    )
+
+    assert await conversations.migrate_state_paths() == (1, 1)
+
+    head = await conversations.conversations.find_one()
+    entry = await conversations.conversation_history.find_one()
+    assert head["state"]["data"] == [STATE_PATH_VERSION, *path]
+    assert entry["entry"]["options"][0]["next"] == [STATE_PATH_VERSION, *path]
+
+    # migrated documents are not matched again
+    assert await conversations.migrate_state_paths() == (0, 0)
@@ -0,0 +1,50 @@
+from api.levels.states import (
+    MessageInstructions,
+    States,
+    UnionStates,
+    UserOption,
+    UserState,
+)
+from api.schemas.conversation import BaseData
+
+
+class _CountData(BaseData[int]):
+    pass
+
+
+class _Count(States[_CountData]):
+    # a user state whose one option names the data it was built from
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def data_type(self):
+        return _CountData
+
+    def init(self) -> _CountData:
+        return _CountData(state=0)
+
+    def next(self, data: _CountData) -> UserState:
+        instructions = MessageInstructions(description=f"{self.name} {data.state}")
+        return UserState(options=[UserOption(instructions=instructions, next=None)])
+
+
+def _descriptions(state: UserState) -> set[str]:
+    return {option.instructions.description for option in state.options}
+
+
+def test_options_from_init_data_are_memoized():
+    union = UnionStates(_Count("other"), base=_Count("base"))
+
+    assert _descriptions(union.next(union.init())) == {"base 0", "other 0"}
+    assert union._options is not None
+    assert _descriptions(union.next(union.init())) == {"base 0", "other 0"}
+
+
+def test_options_follow_the_stored_base_data():
+    union = UnionStates(_Count("other"), base=_Count("base"))
+    union.next(union.init())
+
+    data = union.data_type(state=-1, inner_data={"state": 2})
+
+    assert _descriptions(union.next(data)) == {"base 2", "other 0"}